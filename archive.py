@@ -0,0 +1,80 @@
+from datetime import date, datetime
+
+import database
+
+# Закрытые месяцы переезжают из works.db в годовые файлы works_ГГГГ.db.
+# Порядок: копия в архив → сверка числа строк и сумм → удаление из
+# горячей таблицы. В WAL коммит сразу в две базы не атомарен, поэтому
+# шаги идут отдельными транзакциями; пока месяц не записан в
+# архив_месяцев, экспорт читает его из горячей таблицы, и повторный
+# запуск после сбоя безопасен.
+_СХЕМА_АРХИВА = [
+    """
+    CREATE TABLE IF NOT EXISTS архив.работы (
+        id INTEGER PRIMARY KEY,
+        пользователь_id INTEGER NOT NULL,
+        имя TEXT,
+        код_операции TEXT NOT NULL,
+        количество REAL NOT NULL DEFAULT 1,
+        дата TEXT NOT NULL
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS архив.работы_дата ON работы (дата)",
+    "CREATE INDEX IF NOT EXISTS архив.работы_пользователь_дата ON работы (пользователь_id, дата)",
+]
+
+_СВЕРКА = "SELECT COUNT(*), TOTAL(количество), TOTAL(id) FROM {таблица} WHERE дата >= ? AND дата < ?"
+
+def архивировать_месяц(год: int, месяц: int):
+    # Возвращает (строк, количество); ValueError — если месяц трогать нельзя.
+    ключ = f"{год}-{месяц:02d}"
+    с, по = database.границы_месяца(год, месяц)
+    if по > date.today().replace(day=1).isoformat():
+        raise ValueError(f"{ключ} ещё не закрыт")
+    файл = database.путь_архива(год)
+    with database._пул().запись() as соединение:
+        if соединение.execute("SELECT 1 FROM архив_месяцев WHERE месяц = ?", (ключ,)).fetchone():
+            raise ValueError(f"{ключ} уже в архиве")
+        в_очереди = соединение.execute("""
+            SELECT COUNT(*) FROM очередь_google q JOIN работы w ON w.id = q.работа_id
+            WHERE w.дата >= ? AND w.дата < ?
+        """, (с, по)).fetchone()[0]
+        if в_очереди:
+            raise ValueError(f"{ключ}: {в_очереди} строк ещё не отправлены в Google Таблицу")
+        соединение.execute("ATTACH DATABASE ? AS архив", (файл,))
+        try:
+            for выражение in _СХЕМА_АРХИВА:
+                соединение.execute(выражение)
+            соединение.execute(
+                "INSERT OR REPLACE INTO архив.работы SELECT id, пользователь_id, имя, код_операции, количество, дата "
+                "FROM main.работы WHERE дата >= ? AND дата < ?",
+                (с, по)
+            )
+            соединение.commit()
+
+            горячие = соединение.execute(_СВЕРКА.format(таблица="main.работы"), (с, по)).fetchone()
+            архивные = соединение.execute(_СВЕРКА.format(таблица="архив.работы"), (с, по)).fetchone()
+            if горячие != архивные:
+                raise ValueError(f"{ключ}: архив не сошёлся с базой ({архивные} против {горячие}), ничего не удалено")
+            строк, количество, _ = горячие
+            if not строк:
+                raise ValueError(f"{ключ}: нет работ")
+
+            соединение.execute("DELETE FROM main.работы WHERE дата >= ? AND дата < ?", (с, по))
+            соединение.execute(
+                "INSERT INTO архив_месяцев (месяц, файл, строк, количество, заархивировано) VALUES (?, ?, ?, ?, ?)",
+                (ключ, файл, строк, количество, datetime.now().isoformat())
+            )
+            соединение.commit()
+        except BaseException:
+            соединение.rollback()
+            raise
+        finally:
+            соединение.execute("DETACH DATABASE архив")
+    return строк, количество
+
+def список_архива():
+    with database._пул().чтение() as соединение:
+        return соединение.execute(
+            "SELECT месяц, файл, строк, количество, заархивировано FROM архив_месяцев ORDER BY месяц"
+        ).fetchall()
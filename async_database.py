@@ -0,0 +1,110 @@
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+
+import archive
+import database
+from db_pool import ЧИСЛО_ЧИТАТЕЛЕЙ
+
+# Асинхронная обёртка над database.py для обработчиков бота.
+# Чтения выполняются в пуле потоков, записи — в единственном потоке,
+# который служит очередью писателя: вставки идут строго по одной
+# и не занимают цикл событий.
+_читатели = ThreadPoolExecutor(max_workers=ЧИСЛО_ЧИТАТЕЛЕЙ, thread_name_prefix="бд-чтение")
+_писатель = ThreadPoolExecutor(max_workers=1, thread_name_prefix="бд-запись")
+
+async def _в_потоке(исполнитель, функция, *args, **kwargs):
+    цикл = asyncio.get_running_loop()
+    return await цикл.run_in_executor(исполнитель, functools.partial(функция, *args, **kwargs))
+
+async def прочитать(функция, *args, **kwargs):
+    return await _в_потоке(_читатели, функция, *args, **kwargs)
+
+async def записать(функция, *args, **kwargs):
+    return await _в_потоке(_писатель, функция, *args, **kwargs)
+
+async def проверить_доступ(id: int) -> bool:
+    if database.кэш_доступа_свежий():
+        return database.проверить_доступ(id)
+    return await прочитать(database.проверить_доступ, id)
+
+async def проверить_админа(id: int) -> bool:
+    if database.кэш_доступа_свежий():
+        return database.проверить_админа(id)
+    return await прочитать(database.проверить_админа, id)
+
+async def получить_расценку(код: str):
+    if database.кэш_расценок_загружен():
+        return database.получить_расценку(код)
+    return await прочитать(database.получить_расценку, код)
+
+async def получить_все_расценки():
+    if database.кэш_расценок_загружен():
+        return database.получить_все_расценки()
+    return await прочитать(database.получить_все_расценки)
+
+async def получить_работы_до_сегодня(пользователь_id: int):
+    return await прочитать(database.получить_работы_до_сегодня, пользователь_id)
+
+async def получить_отчёт_до_сегодня(пользователь_id: int):
+    return await прочитать(database.получить_отчёт_до_сегодня, пользователь_id)
+
+async def получить_сводку_по_операциям(с: str, по: str, пользователь_id: int = None):
+    return await прочитать(database.получить_сводку_по_операциям, с, по, пользователь_id)
+
+async def получить_статистику(с: str, по: str) -> dict:
+    if database.статистика_в_кэше(с, по):
+        return database.получить_статистику(с, по)
+    return await прочитать(database.получить_статистику, с, по)
+
+async def проверить_итоги():
+    return await прочитать(database.проверить_итоги)
+
+async def перестроить_итоги() -> int:
+    return await записать(database.перестроить_итоги)
+
+async def выполненные_сроки(задача: str) -> set:
+    return await прочитать(database.выполненные_сроки, задача)
+
+async def отметить_выполнение(задача: str, срок: str):
+    return await записать(database.отметить_выполнение, задача, срок)
+
+async def экспорт_в_csv(месяц: int = None, год: int = None, **фильтры):
+    return await прочитать(database.экспорт_в_csv, месяц, год, **фильтры)
+
+async def добавить_пользователя(id: int, имя: str = None, админ: bool = False):
+    return await записать(database.добавить_пользователя, id, имя, админ)
+
+async def установить_расценку(код: str, ставка: float, единица: str = "шт"):
+    return await записать(database.установить_расценку, код, ставка, единица)
+
+async def добавить_работу(пользователь_id: int, имя: str, код_операции: str, количество: float = 1) -> int:
+    return await записать(database.добавить_работу, пользователь_id, имя, код_операции, количество)
+
+async def добавить_работы(пользователь_id: int, имя: str, позиции) -> list:
+    return await записать(database.добавить_работы, пользователь_id, имя, позиции)
+
+async def архивировать_месяц(год: int, месяц: int):
+    return await записать(archive.архивировать_месяц, год, месяц)
+
+async def список_архива():
+    return await прочитать(archive.список_архива)
+
+async def получить_очередь_google(лимит: int = 100):
+    return await прочитать(database.получить_очередь_google, лимит)
+
+async def работы_для_сверки(с: str, по: str):
+    return await прочитать(database.работы_для_сверки, с, по)
+
+async def удалить_из_очереди_google(идентификаторы):
+    return await записать(database.удалить_из_очереди_google, идентификаторы)
+
+async def снять_отложенные_google(работы):
+    return await записать(database.снять_отложенные_google, работы)
+
+async def отметить_попытку_google(идентификаторы):
+    return await записать(database.отметить_попытку_google, идентификаторы)
+
+def остановить():
+    _читатели.shutdown(wait=True)
+    _писатель.shutdown(wait=True)
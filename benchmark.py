@@ -0,0 +1,167 @@
+import argparse
+import os
+import sqlite3
+import statistics
+import tempfile
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+import database
+import db_pool
+
+# Замер числа соединений и задержек на типичном /add:
+# проверка доступа → расценка → запись работы.
+# «до» — прежний способ (новое соединение на каждый вызов),
+# «после» — функции database.py поверх пула.
+
+_счётчик_соединений = 0
+_исходный_connect = sqlite3.connect
+
+def _считающий_connect(*args, **kwargs):
+    global _счётчик_соединений
+    _счётчик_соединений += 1
+    return _исходный_connect(*args, **kwargs)
+
+def _до_добавление(путь, пользователь_id, код):
+    соединение = sqlite3.connect(путь)
+    соединение.execute("SELECT 1 FROM пользователи WHERE id = ?", (пользователь_id,)).fetchone()
+    соединение = sqlite3.connect(путь)
+    соединение.execute("SELECT ставка, единица FROM расценки WHERE код = ?", (код,)).fetchone()
+    соединение = sqlite3.connect(путь)
+    соединение.execute(
+        "INSERT INTO работы (пользователь_id, имя, код_операции, количество, дата) VALUES (?, ?, ?, ?, ?)",
+        (пользователь_id, "bench", код, 1, datetime.now().isoformat())
+    )
+    соединение.commit()
+    соединение.close()
+
+def _после_добавление(путь, пользователь_id, код):
+    database.проверить_доступ(пользователь_id)
+    database.получить_расценку(код)
+    database.добавить_работу(пользователь_id, "bench", код, 1)
+
+def _подготовить(путь):
+    database.ИМЯ_БАЗЫ = путь
+    database.инициализировать_базу()
+    for i in range(20):
+        database.добавить_пользователя(i, f"bench_{i}")
+    database.установить_расценку("sw_rama_8", 100.0)
+
+def _прогнать(функция, путь, запросов, потоков):
+    global _счётчик_соединений
+    задержки = []
+
+    def один(i):
+        начало = time.perf_counter()
+        функция(путь, i % 20, "sw_rama_8")
+        задержки.append(time.perf_counter() - начало)
+
+    _счётчик_соединений = 0
+    with ThreadPoolExecutor(max_workers=потоков) as исполнитель:
+        list(исполнитель.map(один, range(запросов)))
+    задержки.sort()
+    return {
+        "соединений_на_запрос": _счётчик_соединений / запросов,
+        "p50_мс": statistics.median(задержки) * 1000,
+        "p99_мс": задержки[int(len(задержки) * 0.99) - 1] * 1000,
+    }
+
+def проверить_планы(путь) -> list:
+    # Регрессия: ни один запрос по датам не должен сканировать таблицу работ целиком.
+    database.ИМЯ_БАЗЫ = путь
+    database.инициализировать_базу()
+    запросы = {
+        "работы пользователя": (database.ЗАПРОС_РАБОТ_ПОЛЬЗОВАТЕЛЯ, (1, "2000-01-01", "2000-02-01")),
+        "отчёт /me": (database.ЗАПРОС_ОТЧЁТА_ПОЛЬЗОВАТЕЛЯ, (1, "2000-01-01", "2000-02-01")),
+        "сводка по операциям": (database.ЗАПРОС_СВОДКИ_ПО_ОПЕРАЦИЯМ.format(фильтры=""), ("2000-01-01", "2000-02-01")),
+        "экспорт": (database.запрос_экспорта()[0], ("2000-01-01", "2000-02-01")),
+        "экспорт по сотруднику": (database.запрос_экспорта(пользователь_id=1)[0], ("2000-01-01", "2000-02-01", 1)),
+        "лидеры /stats": (database.ЗАПРОС_ЛИДЕРОВ, ("2000-01-01", "2000-02-01", 10)),
+        "динамика /stats": (database.ЗАПРОС_ДИНАМИКИ, (10, "2000-01-01", "2000-02-01")),
+        "сверка с Google": (database.ЗАПРОС_СВЕРКИ.format(таблица="работы"), ("2000-01-01", "2000-02-01", 10)),
+    }
+    ошибки = []
+    with database._пул().чтение() as соединение:
+        for название, (запрос, параметры) in запросы.items():
+            план = соединение.execute("EXPLAIN QUERY PLAN " + запрос, параметры).fetchall()
+            for *_, шаг in план:
+                if шаг.startswith("SCAN"):
+                    ошибки.append(f"{название}: {шаг}")
+    return ошибки
+
+def _заполнить_год(путь, строк):
+    database.ИМЯ_БАЗЫ = путь
+    database.инициализировать_базу()
+    for i in range(50):
+        database.добавить_пользователя(i, f"bench_{i}")
+    коды = ["sw_rama_8", "sw_kal_qr", "sb_dron", "obletka"]
+    for код in коды:
+        database.установить_расценку(код, 100.0)
+    начало = datetime(2025, 1, 1)
+    шаг = timedelta(days=365) / строк
+    with database._пул().запись() as соединение:
+        соединение.executemany(
+            "INSERT INTO работы (пользователь_id, имя, код_операции, количество, дата) VALUES (?, ?, ?, ?, ?)",
+            ((i % 50, f"bench_{i % 50}", коды[i % 4], 1 + i % 7, (начало + шаг * i).isoformat()) for i in range(строк))
+        )
+
+def замерить_экспорт_года(путь, строк):
+    _заполнить_год(путь, строк)
+    tracemalloc.start()
+    начало = time.perf_counter()
+    файл, _ = database.экспорт_в_csv(с="2025-01-01", по="2026-01-01", сжать=True)
+    длительность = time.perf_counter() - начало
+    _, пик = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    файл.seek(0, os.SEEK_END)
+    размер = файл.tell()
+    файл.close()
+    return длительность, пик, размер
+
+def main():
+    парсер = argparse.ArgumentParser(description="Бенчмарк слоя доступа к SQLite")
+    парсер.add_argument("--requests", type=int, default=2000)
+    парсер.add_argument("--threads", type=int, default=8)
+    парсер.add_argument("--check-plans", action="store_true", help="только проверить планы запросов")
+    парсер.add_argument("--export-year", type=int, metavar="ROWS", help="экспорт синтетического года из ROWS строк")
+    аргументы = парсер.parse_args()
+
+    if аргументы.export_year:
+        with tempfile.TemporaryDirectory() as каталог:
+            длительность, пик, размер = замерить_экспорт_года(os.path.join(каталог, "year.db"), аргументы.export_year)
+            db_pool.закрыть_все()
+        print(
+            f"экспорт {аргументы.export_year} строк: {длительность:.2f} с, "
+            f"пик памяти {пик / 1024 / 1024:.1f} МБ, gzip {размер / 1024 / 1024:.1f} МБ"
+        )
+        return
+
+    if аргументы.check_plans:
+        with tempfile.TemporaryDirectory() as каталог:
+            ошибки = проверить_планы(os.path.join(каталог, "plans.db"))
+            db_pool.закрыть_все()
+        for ошибка in ошибки:
+            print(f"❌ {ошибка}")
+        raise SystemExit(1 if ошибки else 0)
+
+    sqlite3.connect = _считающий_connect
+    with tempfile.TemporaryDirectory() as каталог:
+        путь = os.path.join(каталог, "bench.db")
+        _подготовить(путь)
+        db_pool.закрыть_все()
+        итоги = {
+            "до": _прогнать(_до_добавление, путь, аргументы.requests, аргументы.threads),
+            "после": _прогнать(_после_добавление, путь, аргументы.requests, аргументы.threads),
+        }
+        db_pool.закрыть_все()
+
+    for название, итог in итоги.items():
+        print(
+            f"{название:>6}: соединений/запрос={итог['соединений_на_запрос']:.2f} "
+            f"p50={итог['p50_мс']:.2f} мс p99={итог['p99_мс']:.2f} мс"
+        )
+
+if __name__ == "__main__":
+    main()
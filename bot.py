@@ -1,19 +1,28 @@
 import logging
 import asyncio
-from telegram import Update, InlineKeyboardMarkup, InlineKeyboardButton, ReplyKeyboardMarkup
+from telegram import Update, InlineKeyboardMarkup, InlineKeyboardButton, ReplyKeyboardMarkup, InputFile
 from telegram.ext import (
     Application, CommandHandler, MessageHandler,
     ContextTypes, filters, ConversationHandler, CallbackQueryHandler
 )
-from database import (
-    инициализировать_базу, добавить_пользователя, проверить_доступ,
+import database
+import db_pool
+import async_database
+from async_database import (
+    добавить_пользователя, проверить_доступ,
     проверить_админа, установить_расценку, получить_расценку,
-    получить_все_расценки, добавить_работу, получить_работы_до_сегодня,
-    экспорт_в_csv
+    получить_все_расценки, добавить_работу, добавить_работы, получить_отчёт_до_сегодня,
+    проверить_итоги, перестроить_итоги, экспорт_в_csv, архивировать_месяц, список_архива,
+    получить_статистику
 )
+import config
 from config import ТОКЕН_БОТА, ВЛАДЕЛЕЦ_ID, ПОЛУЧАТЕЛЬ_ОТЧЁТОВ_ID
-from scheduler import запустить_планировщик
-from datetime import datetime
+from scheduler import Планировщик
+from sheets import запустить_отправку_в_google, разбудить_отправку, сверить_с_google, текст_сверки
+from metrics import замерено, инструментировать_модуль, следить_за_циклом, запустить_сервер, профилировщик
+from notifications import ДиспетчерУведомлений, Уведомление, РЕЖИМ_ПО_УМОЛЧАНИЮ, ОКНО_СКЛЕЙКИ
+from webhook import запустить_вебхук, ХОСТ_ПО_УМОЛЧАНИЮ, ПОРТ_ПО_УМОЛЧАНИЮ, ПУТЬ_ПО_УМОЛЧАНИЮ
+from datetime import datetime, date, timedelta
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -31,9 +40,10 @@ logger = logging.getLogger(__name__)
     "obletka": "8) Облетка"
 }
 
+@замерено("handler")
 async def старт(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = update.effective_user.id
-    if not проверить_доступ(user_id):
+    if not await проверить_доступ(user_id):
         await update.message.reply_text("❌ Доступ запрещён.")
         return
     клавиатура = [["/add", "/me"], ["/rates"]]
@@ -45,10 +55,12 @@ async def старт(update: Update, context: ContextTypes.DEFAULT_TYPE):
         "Доступные команды:\n"
         "/me — ваша зарплата с начала месяца\n"
         "/add — добавить выполненную операцию\n"
+        "/bulk — добавить сразу несколько: /bulk sw_rama_8 10; sb_dron 3\n"
         "/rates — список расценок",
         reply_markup=reply_markup
     )
 
+@замерено("handler")
 async def выдать_доступ(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = update.effective_user.id
     if user_id != ВЛАДЕЛЕЦ_ID:
@@ -60,14 +72,15 @@ async def выдать_доступ(update: Update, context: ContextTypes.DEFAUL
     try:
         целевой_id = int(context.args[0])
         имя = context.args[1] if len(context.args) > 1 else f"пользователь_{целевой_id}"
-        добавить_пользователя(целевой_id, имя)
+        await добавить_пользователя(целевой_id, имя)
         await update.message.reply_text(f"✅ Доступ выдан: {имя} ({целевой_id})")
     except ValueError:
         await update.message.reply_text("❌ Неверный ID.")
 
+@замерено("handler")
 async def установить_расценку_команда(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = update.effective_user.id
-    if not проверить_админа(user_id):
+    if not await проверить_админа(user_id):
         await update.message.reply_text("🚫 Только админ может устанавливать расценки.")
         return
     if len(context.args) < 2:
@@ -79,42 +92,47 @@ async def установить_расценку_команда(update: Update, c
     except ValueError:
         await update.message.reply_text("❌ Ставка должна быть числом.")
         return
-    установить_расценку(код, ставка, "шт")
+    await установить_расценку(код, ставка, "шт")
     название = НАЗВАНИЯ_ОПЕРАЦИЙ.get(код, код)
     await update.message.reply_text(f"✅ Расценка: {название} = {ставка} руб/шт")
 
+@замерено("handler")
 async def моя_зп_сегодня(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = update.effective_user.id
-    if not проверить_доступ(user_id):
+    if not await проверить_доступ(user_id):
         await update.message.reply_text("❌ Доступ запрещён.")
         return
-    работы = получить_работы_до_сегодня(user_id)
-    if not работы:
+    отчёт = await получить_отчёт_до_сегодня(user_id)
+    if not отчёт:
         await update.message.reply_text("📭 Нет работ с начала месяца.")
         return
     итого = 0.0
     детали = []
-    for тип_операции, колво, дата in работы:
-        расценка = получить_расценку(тип_операции)
-        if расценка:
-            ставка, единица = расценка
-            сумма = колво * ставка
+    по_операциям = {}
+    for день, тип_операции, колво, ставка, единица, сумма in отчёт:
+        по_операциям[тип_операции] = по_операциям.get(тип_операции, 0) + колво
+        if ставка is not None:
             итого += сумма
-            дата_стр = дата[:10]
             название = НАЗВАНИЯ_ОПЕРАЦИЙ.get(тип_операции, тип_операции)
-            детали.append(f"• {дата_стр} | {название}: {колво} {единица} × {ставка} = {сумма:.2f} руб")
+            детали.append(f"• {день} | {название}: {колво} {единица} × {ставка} = {сумма:.2f} руб")
         else:
-            детали.append(f"• {тип_операции}: {колво} — ❌ без расценки")
+            детали.append(f"• {день} | {тип_операции}: {колво} — ❌ без расценки")
     сейчас = datetime.now()
     период = f"с 01.{сейчас.month:02d}.{сейчас.year} по {сейчас.day:02d}.{сейчас.month:02d}.{сейчас.year}"
-    текст = f"💰 Ваша зарплата {период}:\n\n" + "\n".join(детали) + f"\n\nИТОГО: {итого:.2f} руб"
+    сводка = [f"• {НАЗВАНИЯ_ОПЕРАЦИЙ.get(код, код)}: {колво}" for код, колво in sorted(по_операциям.items())]
+    текст = (
+        f"💰 Ваша зарплата {период}:\n\n" + "\n".join(детали)
+        + "\n\n📦 По операциям:\n" + "\n".join(сводка)
+        + f"\n\nИТОГО: {итого:.2f} руб"
+    )
     await update.message.reply_text(текст)
 
+@замерено("handler")
 async def список_расценок(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = update.effective_user.id
-    if not проверить_доступ(user_id):
+    if not await проверить_доступ(user_id):
         return
-    расценки = получить_все_расценки()
+    расценки = await получить_все_расценки()
     if not расценки:
         await update.message.reply_text("📭 Нет расценок.")
         return
@@ -124,25 +142,195 @@ async def список_расценок(update: Update, context: ContextTypes.DE
         текст += f"• {название}: {ставка} руб/шт\n"
     await update.message.reply_text(текст)
 
+ИСПОЛЬЗОВАНИЕ_ЭКСПОРТА = (
+    "Использование: /export [ГГГГ-ММ | ГГГГ-ММ-ДД ГГГГ-ММ-ДД] [user=ID] [op=код] [gz]\n"
+    "Вторая дата диапазона не включается."
+)
+
+def разобрать_аргументы_экспорта(аргументы) -> dict:
+    параметры = {}
+    даты = []
+    for аргумент in аргументы:
+        if аргумент.startswith("user="):
+            параметры["пользователь_id"] = int(аргумент[5:])
+        elif аргумент.startswith("op="):
+            параметры["код_операции"] = аргумент[3:]
+        elif аргумент == "gz":
+            параметры["сжать"] = True
+        else:
+            даты.append(аргумент)
+    if len(даты) == 1:
+        месяц = datetime.strptime(даты[0], "%Y-%m")
+        параметры["год"], параметры["месяц"] = месяц.year, месяц.month
+    elif len(даты) == 2:
+        с, по = (datetime.strptime(д, "%Y-%m-%d").date() for д in даты)
+        if с >= по:
+            raise ValueError("начало диапазона должно быть раньше конца")
+        параметры["с"], параметры["по"] = с.isoformat(), по.isoformat()
+    elif даты:
+        raise ValueError("слишком много дат")
+    return параметры
+
+@замерено("handler")
 async def экспорт_команда(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = update.effective_user.id
-    if not проверить_админа(user_id):
+    if not await проверить_админа(user_id):
         await update.message.reply_text("🚫 Только админ может экспортировать.")
         return
     try:
-        путь = экспорт_в_csv()
-        with open(путь, "rb") as f:
-            await update.message.reply_document(document=f, caption="📄 Экспорт за текущий месяц")
+        параметры = разобрать_аргументы_экспорта(context.args or [])
+    except ValueError:
+        await update.message.reply_text(ИСПОЛЬЗОВАНИЕ_ЭКСПОРТА)
+        return
+    try:
+        файл, имя_файла = await экспорт_в_csv(**параметры)
+        # PTB не принимает SpooledTemporaryFile без имени и всё равно читает тело в память.
+        with файл:
+            документ = InputFile(await asyncio.to_thread(файл.read), filename=имя_файла)
+        await update.message.reply_document(document=документ, caption=f"📄 {имя_файла}")
+    except Exception as e:
+        await update.message.reply_text(f"❌ Ошибка: {e}")
+
+ИСПОЛЬЗОВАНИЕ_СТАТИСТИКИ = (
+    "Использование: /stats [ГГГГ | ГГГГ-ММ | ГГГГ-ММ-ДД ГГГГ-ММ-ДД]\n"
+    "Без аргументов — текущий месяц. Вторая дата диапазона не включается."
+)
+
+def разобрать_период(аргументы):
+    if not аргументы:
+        сегодня = date.today()
+        return database.границы_месяца(сегодня.year, сегодня.month)
+    if len(аргументы) == 1 and len(аргументы[0]) == 4:
+        год = int(аргументы[0])
+        return date(год, 1, 1).isoformat(), date(год + 1, 1, 1).isoformat()
+    if len(аргументы) == 1:
+        месяц = datetime.strptime(аргументы[0], "%Y-%m")
+        return database.границы_месяца(месяц.year, месяц.month)
+    if len(аргументы) == 2:
+        с, по = (datetime.strptime(д, "%Y-%m-%d").date() for д in аргументы)
+        if с >= по:
+            raise ValueError("начало диапазона должно быть раньше конца")
+        return с.isoformat(), по.isoformat()
+    raise ValueError("слишком много аргументов")
+
+def текст_статистики(с: str, по: str, статистика: dict) -> str:
+    последний_день = date.fromisoformat(по) - timedelta(days=1)
+    части = [f"📈 Статистика {с} – {последний_день.isoformat()}"]
+    лидеры = [
+        f"{место}. {имя or пид}: {сумма:.2f} руб ({записей} зап.)"
+        for место, (пид, имя, сумма, записей) in enumerate(статистика["лидеры"], start=1)
+    ]
+    части.append("🏆 Лидеры:\n" + ("\n".join(лидеры) or "—"))
+    операции = [
+        f"• {НАЗВАНИЯ_ОПЕРАЦИЙ.get(код, код)}: {колво:.10g} ({записей} зап.)" + (f" — {сумма:.2f} руб" if ставка is not None else "")
+        for код, колво, записей, ставка, сумма in статистика["операции"]
+    ]
+    части.append("📦 По операциям:\n" + ("\n".join(операции) or "—"))
+    динамика = [
+        f"• {шаг}: {колво:.10g} шт, {записей} зап., {сумма:.2f} руб"
+        for шаг, колво, записей, сумма in статистика["динамика"]
+    ]
+    части.append("📅 Динамика:\n" + ("\n".join(динамика) or "—"))
+    if статистика["без_расценки"]:
+        без_расценки = [f"• {код}: {колво:.10g} ({записей} зап.)" for код, колво, записей in статистика["без_расценки"]]
+        части.append("⚠️ Без расценки (в экспорте идут как 0):\n" + "\n".join(без_расценки))
+    return "\n\n".join(части)
+
+@замерено("handler")
+async def статистика_команда(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    user_id = update.effective_user.id
+    if not await проверить_админа(user_id):
+        await update.message.reply_text("🚫 Только админ может смотреть статистику.")
+        return
+    try:
+        с, по = разобрать_период(context.args or [])
+    except ValueError:
+        await update.message.reply_text(ИСПОЛЬЗОВАНИЕ_СТАТИСТИКИ)
+        return
+    статистика = await получить_статистику(с, по)
+    await update.message.reply_text(текст_статистики(с, по, статистика))
+
+@замерено("handler")
+async def сверка_команда(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    user_id = update.effective_user.id
+    if not await проверить_админа(user_id):
+        await update.message.reply_text("🚫 Только админ может запускать сверку.")
+        return
+    аргументы = list(context.args or [])
+    дописать = "check" not in аргументы
+    if not дописать:
+        аргументы.remove("check")
+    try:
+        с, по = разобрать_период(аргументы)
+    except ValueError:
+        await update.message.reply_text(
+            "Использование: /reconcile [ГГГГ | ГГГГ-ММ | ГГГГ-ММ-ДД ГГГГ-ММ-ДД] [check]\n"
+            "check — только показать, ничего не дописывать."
+        )
+        return
+    try:
+        отчёт = await сверить_с_google(с, по, дописать=дописать)
     except Exception as e:
         await update.message.reply_text(f"❌ Ошибка: {e}")
+        return
+    await update.message.reply_text(текст_сверки(отчёт))
+
+@замерено("handler")
+async def итоги_команда(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    user_id = update.effective_user.id
+    if not await проверить_админа(user_id):
+        await update.message.reply_text("🚫 Только админ может проверять итоги.")
+        return
+    действие = context.args[0] if context.args else "verify"
+    if действие == "rebuild":
+        строк = await перестроить_итоги()
+        await update.message.reply_text(f"✅ Итоги пересчитаны: {строк} строк.")
+    elif действие == "verify":
+        расхождения = await проверить_итоги()
+        if not расхождения:
+            await update.message.reply_text("✅ Итоги совпадают с работами.")
+            return
+        строки = [f"• {пид} {день} {код}: итоги {было}, работы {надо}" for пид, день, код, было, надо in расхождения[:20]]
+        await update.message.reply_text(
+            f"❌ Расхождений: {len(расхождения)}\n" + "\n".join(строки) + "\n\nИсправить: /rollup rebuild"
+        )
+    else:
+        await update.message.reply_text("Использование: /rollup [verify|rebuild]")
 
+@замерено("handler")
+async def архив_команда(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    user_id = update.effective_user.id
+    if not await проверить_админа(user_id):
+        await update.message.reply_text("🚫 Только админ может архивировать.")
+        return
+    if not context.args:
+        архив = await список_архива()
+        if not архив:
+            await update.message.reply_text("📭 Архив пуст.\n\nИспользование: /archive ГГГГ-ММ")
+            return
+        строки = [f"• {месяц}: {строк} зап., {колво:.10g} шт → {файл}" for месяц, файл, строк, колво, _ in архив]
+        await update.message.reply_text("🗄 В архиве:\n" + "\n".join(строки))
+        return
+    try:
+        месяц = datetime.strptime(context.args[0], "%Y-%m")
+    except ValueError:
+        await update.message.reply_text("Использование: /archive [ГГГГ-ММ]")
+        return
+    try:
+        строк, колво = await архивировать_месяц(месяц.year, месяц.month)
+    except ValueError as e:
+        await update.message.reply_text(f"❌ {e}")
+        return
+    await update.message.reply_text(f"✅ {context.args[0]} перенесён в архив: {строк} зап., {колво:.10g} шт.")
+
+@замерено("handler")
 async def начать_добавление(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = update.effective_user.id
-    if not проверить_доступ(user_id):
+    if not await проверить_доступ(user_id):
         await update.message.reply_text("❌ Доступ запрещён.")
         return ВЫБОР_ОПЕРАЦИИ
 
-    расценки = получить_все_расценки()
+    расценки = await получить_все_расценки()
     if not расценки:
         await update.message.reply_text("📭 Нет доступных операций.")
         return ВЫБОР_ОПЕРАЦИИ
@@ -162,6 +350,7 @@ async def начать_добавление(update: Update, context: ContextType
     await update.message.reply_text("Выберите операцию:", reply_markup=клавиатура)
     return ВЫБОР_ОПЕРАЦИИ
 
+@замерено("handler")
 async def выбрать_операцию(update: Update, context: ContextTypes.DEFAULT_TYPE):
     запрос = update.callback_query
     await запрос.answer()
@@ -171,6 +360,7 @@ async def выбрать_операцию(update: Update, context: ContextTypes.
     await запрос.edit_message_text(f"Вы выбрали: {название}\n\n✏️ Введите количество (только число):")
     return ВВОД_КОЛИЧЕСТВА
 
+@замерено("handler")
 async def ввести_количество(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = update.effective_user.id
     имя = update.effective_user.username or f"пользователь_{user_id}"
@@ -188,37 +378,147 @@ async def ввести_количество(update: Update, context: ContextType
         await update.message.reply_text("❌ Введите положительное число (например: 1, 2.5)")
         return ВВОД_КОЛИЧЕСТВА
 
-    расценка = получить_расценку(код)
+    расценка = await получить_расценку(код)
     if not расценка:
         await update.message.reply_text("❌ Ошибка: расценка не найдена.")
         return ВВОД_КОЛИЧЕСТВА
 
     ставка, единица = расценка
     сумма = количество * ставка
-    добавить_работу(user_id, имя, код, количество)
+    await добавить_работу(user_id, имя, код, количество)
+    разбудить_отправку()
 
-    from sheets import добавить_в_google
-    добавить_в_google(имя, код, количество, ставка, сумма, user_id)
-
-    бот = context.bot
-    try:
-        await бот.send_message(
-            chat_id=ВЛАДЕЛЕЦ_ID,
-            text=f"🔔 Новая работа!\n\n👤 @{имя} ({user_id})\n📄 {НАЗВАНИЯ_ОПЕРАЦИЙ.get(код, код)}: {количество} {единица}\n💰 {сумма:.2f} руб"
-        )
-    except Exception as e:
-        logging.error(f"Не удалось отправить уведомление: {e}")
+    название = НАЗВАНИЯ_ОПЕРАЦИЙ.get(код, код)
+    context.bot_data["уведомления"].уведомить(Уведомление(
+        подробно=f"🔔 Новая работа!\n\n👤 @{имя} ({user_id})\n📄 {название}: {количество} {единица}\n💰 {сумма:.2f} руб",
+        кратко=f"@{имя}: {название} — {количество} {единица}, {сумма:.2f} руб",
+        сумма=сумма,
+    ))
 
     await update.message.reply_text(
         f"✅ Готово!\n{НАЗВАНИЯ_ОПЕРАЦИЙ.get(код, код)}: {количество} {единица}\n💰 Заработано: {сумма:.2f} руб"
     )
     return ВВОД_КОЛИЧЕСТВА
 
+МАКС_ПОЗИЦИЙ = 30
+ИСПОЛЬЗОВАНИЕ_ПАКЕТА = (
+    "Использование: /bulk <код> <кол-во>; <код> <кол-во>; ...\n"
+    "Позиции можно разделять «;» или переводом строки. Коды — см. /rates."
+)
+
+def разобрать_пакет(текст: str, расценки: dict) -> list:
+    # Возвращает [(код, количество)]; все коды сверяются с одной копией расценок.
+    позиции = []
+    неизвестные = []
+    for часть in текст.replace("\n", ";").split(";"):
+        слова = часть.split()
+        if not слова:
+            continue
+        if len(слова) != 2:
+            raise ValueError(f"не понял «{часть.strip()}»")
+        код, количество = слова
+        try:
+            количество = float(количество.replace(",", "."))
+        except ValueError:
+            raise ValueError(f"количество для {код} должно быть числом")
+        if количество <= 0:
+            raise ValueError(f"количество для {код} должно быть положительным")
+        if код not in расценки:
+            неизвестные.append(код)
+        позиции.append((код, количество))
+    if неизвестные:
+        raise ValueError("нет расценки: " + ", ".join(неизвестные))
+    if not позиции:
+        raise ValueError("нет позиций")
+    if len(позиции) > МАКС_ПОЗИЦИЙ:
+        raise ValueError(f"не больше {МАКС_ПОЗИЦИЙ} позиций за раз")
+    return позиции
+
+@замерено("handler")
+async def пакет_команда(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    user_id = update.effective_user.id
+    if not await проверить_доступ(user_id):
+        await update.message.reply_text("❌ Доступ запрещён.")
+        return
+    имя = update.effective_user.username or f"пользователь_{user_id}"
+    части = update.message.text.split(maxsplit=1)
+    расценки = {код: (ставка, единица) for код, ставка, единица in await получить_все_расценки()}
+    try:
+        позиции = разобрать_пакет(части[1] if len(части) > 1 else "", расценки)
+    except ValueError as e:
+        await update.message.reply_text(f"❌ Ошибка: {e}\n\n{ИСПОЛЬЗОВАНИЕ_ПАКЕТА}")
+        return
+
+    await добавить_работы(user_id, имя, позиции)
+    разбудить_отправку()
+
+    итого = 0.0
+    строки = []
+    for код, количество in позиции:
+        ставка, единица = расценки[код]
+        сумма = количество * ставка
+        итого += сумма
+        строки.append(f"• {НАЗВАНИЯ_ОПЕРАЦИЙ.get(код, код)}: {количество} {единица} = {сумма:.2f} руб")
+    context.bot_data["уведомления"].уведомить(Уведомление(
+        подробно=f"🔔 Новые работы ({len(позиции)})!\n\n👤 @{имя} ({user_id})\n" + "\n".join(строки) + f"\n💰 {итого:.2f} руб",
+        кратко=f"@{имя}: {len(позиции)} поз., {итого:.2f} руб",
+        сумма=итого,
+    ))
+    await update.message.reply_text(
+        f"✅ Записано позиций: {len(позиции)}\n" + "\n".join(строки) + f"\n💰 Заработано: {итого:.2f} руб"
+    )
+
+async def при_запуске(приложение: Application):
+    остановка = asyncio.Event()
+    приложение.bot_data["остановка"] = остановка
+    планировщик = Планировщик(приложение.bot)
+    приложение.bot_data["планировщик"] = планировщик
+    уведомления = ДиспетчерУведомлений(
+        приложение.bot, ВЛАДЕЛЕЦ_ID,
+        режим=getattr(config, "РЕЖИМ_УВЕДОМЛЕНИЙ", РЕЖИМ_ПО_УМОЛЧАНИЮ),
+        окно=getattr(config, "ОКНО_УВЕДОМЛЕНИЙ", ОКНО_СКЛЕЙКИ),
+    )
+    приложение.bot_data["уведомления"] = уведомления
+    приложение.bot_data["фоновые_задачи"] = [
+        asyncio.create_task(запустить_отправку_в_google(остановка=остановка)),
+        asyncio.create_task(планировщик.запустить()),
+        asyncio.create_task(уведомления.запустить()),
+        asyncio.create_task(следить_за_циклом(остановка)),
+    ]
+    порт_метрик = getattr(config, "ПОРТ_МЕТРИК", None)
+    if порт_метрик:
+        приложение.bot_data["сервер_метрик"] = запустить_сервер("127.0.0.1", порт_метрик)
+    if getattr(config, "ПРОФИЛИРОВАНИЕ", False):
+        профилировщик.включить()
+
+async def при_остановке(приложение: Application):
+    приложение.bot_data["остановка"].set()
+    приложение.bot_data["планировщик"].остановить()
+    приложение.bot_data["уведомления"].остановить()
+    результаты = await asyncio.gather(*приложение.bot_data["фоновые_задачи"], return_exceptions=True)
+    for задача, результат in zip(приложение.bot_data["фоновые_задачи"], результаты):
+        # Упавшая раньше времени задача иначе пропала бы без следа.
+        if isinstance(результат, Exception):
+            logger.error(f"Фоновая задача {задача.get_coro().__qualname__} завершилась ошибкой: {результат!r}")
+    if "сервер_метрик" in приложение.bot_data:
+        приложение.bot_data["сервер_метрик"].shutdown()
+    профилировщик.выключить()
+    # Обработчики и фоновые задачи уже завершены: закрываем потоки и соединения базы.
+    async_database.остановить()
+    db_pool.закрыть_все()
+
 def основная():
-    инициализировать_базу()
-    добавить_пользователя(ВЛАДЕЛЕЦ_ID, "владелец", админ=True)
+    инструментировать_модуль(database, "db", использует="_пул")
+    database.инициализировать_базу()
+    database.загрузить_доступ()
+    database.добавить_пользователя(ВЛАДЕЛЕЦ_ID, "владелец", админ=True)
 
-    приложение = Application.builder().token(ТОКЕН_БОТА).build()
+    строитель = Application.builder().token(ТОКЕН_БОТА).concurrent_updates(True).post_init(при_запуске).post_stop(при_остановке)
+    # Свой адрес Bot API — локальный сервер или заглушка из fake_telegram.py для нагрузки без Telegram.
+    адрес_api = getattr(config, "АДРЕС_BOT_API", None)
+    if адрес_api:
+        строитель = строитель.base_url(f"{адрес_api}/bot").base_file_url(f"{адрес_api}/file/bot")
+    приложение = строитель.build()
 
     приложение.add_handler(CommandHandler("start", старт))
     приложение.add_handler(CommandHandler("grant", выдать_доступ))
@@ -226,6 +526,11 @@ def основная():
     приложение.add_handler(CommandHandler("me", моя_зп_сегодня))
     приложение.add_handler(CommandHandler("rates", список_расценок))
     приложение.add_handler(CommandHandler("export", экспорт_команда))
+    приложение.add_handler(CommandHandler("rollup", итоги_команда))
+    приложение.add_handler(CommandHandler("bulk", пакет_команда))
+    приложение.add_handler(CommandHandler("archive", архив_команда))
+    приложение.add_handler(CommandHandler("stats", статистика_команда))
+    приложение.add_handler(CommandHandler("reconcile", сверка_команда))
 
     диалог_добавления = ConversationHandler(
         entry_points=[CommandHandler("add", начать_добавление)],
@@ -237,9 +542,18 @@ def основная():
     )
     приложение.add_handler(диалог_добавления)
 
-    цикл = asyncio.get_event_loop()
-    цикл.create_task(запустить_планировщик())
-    приложение.run_polling()
+    # "polling" — long polling, "webhook" — см. webhook.py.
+    if getattr(config, "РЕЖИМ_ЗАПУСКА", "polling") == "webhook":
+        asyncio.run(запустить_вебхук(
+            приложение,
+            секрет=getattr(config, "ВЕБХУК_СЕКРЕТ", None),
+            хост=getattr(config, "ВЕБХУК_ХОСТ", ХОСТ_ПО_УМОЛЧАНИЮ),
+            порт=getattr(config, "ВЕБХУК_ПОРТ", ПОРТ_ПО_УМОЛЧАНИЮ),
+            путь=getattr(config, "ВЕБХУК_ПУТЬ", ПУТЬ_ПО_УМОЛЧАНИЮ),
+            url=getattr(config, "ВЕБХУК_URL", None),
+        ))
+    else:
+        приложение.run_polling()
 
 if __name__ == "__main__":
     основная()
\ No newline at end of file
@@ -1,15 +1,209 @@
-import sqlite3
+import io
 import os
+import math
 import csv
-from datetime import datetime
+import gzip
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, date, timedelta
+from db_pool import получить_пул
 
 ИМЯ_БАЗЫ = "works.db"
 
+# Миграции применяются по порядку; номер последней применённой
+# хранится в PRAGMA user_version. Новые миграции — только в конец списка.
+_МИГРАЦИИ = [
+    [
+        "CREATE INDEX IF NOT EXISTS работы_пользователь_дата ON работы (пользователь_id, дата)",
+        "CREATE INDEX IF NOT EXISTS работы_дата ON работы (дата)",
+    ],
+    [
+        """
+        CREATE TABLE IF NOT EXISTS очередь_google (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            работа_id INTEGER NOT NULL,
+            ставка REAL,
+            сумма REAL,
+            попыток INTEGER NOT NULL DEFAULT 0
+        )
+        """,
+    ],
+    [
+        """
+        CREATE TABLE IF NOT EXISTS итоги_по_дням (
+            пользователь_id INTEGER NOT NULL,
+            день TEXT NOT NULL,
+            код_операции TEXT NOT NULL,
+            количество REAL NOT NULL DEFAULT 0,
+            записей INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (пользователь_id, день, код_операции)
+        ) WITHOUT ROWID
+        """,
+        "CREATE INDEX IF NOT EXISTS итоги_по_дням_день ON итоги_по_дням (день)",
+        "DELETE FROM итоги_по_дням",
+        """
+        INSERT INTO итоги_по_дням (пользователь_id, день, код_операции, количество, записей)
+        SELECT пользователь_id, substr(дата, 1, 10), код_операции, SUM(количество), COUNT(*)
+        FROM работы
+        GROUP BY пользователь_id, substr(дата, 1, 10), код_операции
+        """,
+    ],
+    [
+        """
+        CREATE TABLE IF NOT EXISTS выполненные_задачи (
+            задача TEXT NOT NULL,
+            срок TEXT NOT NULL,
+            выполнено TEXT NOT NULL,
+            PRIMARY KEY (задача, срок)
+        )
+        """,
+    ],
+    [
+        """
+        CREATE TABLE IF NOT EXISTS архив_месяцев (
+            месяц TEXT PRIMARY KEY,
+            файл TEXT NOT NULL,
+            строк INTEGER NOT NULL,
+            количество REAL NOT NULL,
+            заархивировано TEXT NOT NULL
+        )
+        """,
+    ],
+    [
+        "CREATE INDEX IF NOT EXISTS очередь_google_работа ON очередь_google (работа_id, попыток)",
+    ],
+]
+
+# Даты хранятся в ISO-формате, поэтому полуоткрытый диапазон [с, по)
+# сравнивается как строки и использует индексы по дате.
+ЗАПРОС_РАБОТ_ПОЛЬЗОВАТЕЛЯ = """
+    SELECT код_операции, количество, дата
+    FROM работы
+    WHERE пользователь_id = ? AND дата >= ? AND дата < ?
+    ORDER BY дата
+"""
+
+ЗАПРОС_ЭКСПОРТА = """
+    SELECT w.дата, u.имя, w.код_операции, w.количество, r.ставка
+    FROM {таблица} w
+    JOIN пользователи u ON w.пользователь_id = u.id
+    LEFT JOIN расценки r ON w.код_операции = r.код
+    WHERE w.дата >= ? AND w.дата < ?{фильтры}
+    ORDER BY w.дата
+"""
+
+# Итоги по дням ведутся вместе с записью работ, поэтому отчёты
+# стоят «дни × операции», а не «число записей».
+ЗАПРОС_ОТЧЁТА_ПОЛЬЗОВАТЕЛЯ = """
+    SELECT i.день, i.код_операции, i.количество,
+           r.ставка, r.единица, i.количество * r.ставка
+    FROM итоги_по_дням i
+    LEFT JOIN расценки r ON i.код_операции = r.код
+    WHERE i.пользователь_id = ? AND i.день >= ? AND i.день < ?
+    ORDER BY i.день, i.код_операции
+"""
+
+ЗАПРОС_СВОДКИ_ПО_ОПЕРАЦИЯМ = """
+    SELECT i.код_операции, SUM(i.количество), SUM(i.записей),
+           r.ставка, SUM(i.количество) * r.ставка
+    FROM итоги_по_дням i
+    LEFT JOIN расценки r ON i.код_операции = r.код
+    WHERE i.день >= ? AND i.день < ?{фильтры}
+    GROUP BY i.код_операции
+    ORDER BY i.код_операции
+"""
+
+# Запросы /stats тоже идут по итогам: «дни × операции», а не сырые работы.
+ЗАПРОС_ЛИДЕРОВ = """
+    SELECT i.пользователь_id, u.имя, SUM(i.количество * r.ставка) AS сумма, SUM(i.записей)
+    FROM итоги_по_дням i
+    JOIN расценки r ON i.код_операции = r.код
+    LEFT JOIN пользователи u ON i.пользователь_id = u.id
+    WHERE i.день >= ? AND i.день < ?
+    GROUP BY i.пользователь_id
+    ORDER BY сумма DESC
+    LIMIT ?
+"""
+
+# Длина префикса дня задаёт шаг: 10 — по дням, 7 — по месяцам, 4 — по годам.
+ЗАПРОС_ДИНАМИКИ = """
+    SELECT substr(i.день, 1, ?) AS шаг, SUM(i.количество), SUM(i.записей), TOTAL(i.количество * r.ставка)
+    FROM итоги_по_дням i
+    LEFT JOIN расценки r ON i.код_операции = r.код
+    WHERE i.день >= ? AND i.день < ?
+    GROUP BY шаг
+    ORDER BY шаг
+"""
+
+_ОБНОВИТЬ_ИТОГИ = """
+    INSERT INTO итоги_по_дням (пользователь_id, день, код_операции, количество, записей)
+    VALUES (?, ?, ?, ?, 1)
+    ON CONFLICT (пользователь_id, день, код_операции) DO UPDATE SET
+        количество = количество + excluded.количество,
+        записей = записей + 1
+"""
+
+# Итоги заархивированных месяцев остаются в горячей базе, а сырых
+# работ за них там уже нет — сверка и пересчёт эти месяцы пропускают.
+_НЕ_В_АРХИВЕ = "NOT IN (SELECT месяц FROM архив_месяцев)"
+
+_ИТОГИ_ИЗ_РАБОТ = f"""
+    SELECT пользователь_id, substr(дата, 1, 10) AS день, код_операции, SUM(количество), COUNT(*)
+    FROM работы
+    WHERE substr(дата, 1, 7) {_НЕ_В_АРХИВЕ}
+    GROUP BY пользователь_id, день, код_операции
+"""
+
+# Таблица расценок крошечная и читается почти каждым обработчиком,
+# поэтому держим её копию в памяти. Поколение защищает от гонки,
+# когда загрузка началась до сброса, а закончилась после.
+_кэш_расценок = None
+_поколение_расценок = 0
+_замок_расценок = threading.Lock()
+
+# Права доступа тоже в памяти: проверка — поиск во множестве.
+# Изменения через добавить_пользователя видны сразу, а правки works.db
+# сторонними скриптами (add_me.py) подтягиваются не позже чем через TTL.
+ВРЕМЯ_ЖИЗНИ_ДОСТУПА = 60
+_доступ = frozenset()
+_админы = frozenset()
+_доступ_загружен_в = None
+_поколение_доступа = 0
+_замок_доступа = threading.Lock()
+
+# Статистика запоминается по периоду (с, по). Новая работа сбрасывает
+# только периоды, куда попадает её день, поэтому закрытые месяцы
+# считаются один раз; смена расценки меняет суммы везде и сбрасывает всё.
+МАКС_ПЕРИОДОВ_СТАТИСТИКИ = 64
+ЛИДЕРОВ_В_СТАТИСТИКЕ = 10
+_кэш_статистики = {}
+_поколение_статистики = 0
+_замок_статистики = threading.Lock()
+
+def _пул():
+    return получить_пул(ИМЯ_БАЗЫ)
+
+def границы_месяца(год: int, месяц: int):
+    начало = date(год, месяц, 1)
+    конец = date(год + 1, 1, 1) if месяц == 12 else date(год, месяц + 1, 1)
+    return начало.isoformat(), конец.isoformat()
+
 def инициализировать_базу():
-    соединение = sqlite3.connect(ИМЯ_БАЗЫ)
-    курсор = соединение.cursor()
+    with _пул().запись() as соединение:
+        _создать_таблицы(соединение)
+        _применить_миграции(соединение)
+
+def _применить_миграции(соединение):
+    версия = соединение.execute("PRAGMA user_version").fetchone()[0]
+    for номер, выражения in enumerate(_МИГРАЦИИ[версия:], start=версия + 1):
+        for выражение in выражения:
+            соединение.execute(выражение)
+        соединение.execute(f"PRAGMA user_version = {номер}")
 
-    курсор.execute("""
+def _создать_таблицы(соединение):
+    соединение.execute("""
         CREATE TABLE IF NOT EXISTS пользователи (
             id INTEGER PRIMARY KEY,
             имя TEXT,
@@ -17,7 +211,7 @@ def инициализировать_базу():
         )
     """)
 
-    курсор.execute("""
+    соединение.execute("""
         CREATE TABLE IF NOT EXISTS расценки (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
             код TEXT UNIQUE NOT NULL,
@@ -26,7 +220,7 @@ def инициализировать_базу():
         )
     """)
 
-    курсор.execute("""
+    соединение.execute("""
         CREATE TABLE IF NOT EXISTS работы (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
             пользователь_id INTEGER NOT NULL,
@@ -37,108 +231,379 @@ def инициализировать_базу():
         )
     """)
 
-    соединение.commit()
-    соединение.close()
-
 def добавить_пользователя(id: int, имя: str = None, админ: bool = False):
-    соединение = sqlite3.connect(ИМЯ_БАЗЫ)
-    курсор = соединение.cursor()
-    курсор.execute(
-        "INSERT OR REPLACE INTO пользователи (id, имя, админ) VALUES (?, ?, ?)",
-        (id, имя or f"пользователь_{id}", int(админ))
-    )
-    соединение.commit()
-    соединение.close()
+    with _пул().запись() as соединение:
+        соединение.execute(
+            "INSERT OR REPLACE INTO пользователи (id, имя, админ) VALUES (?, ?, ?)",
+            (id, имя or f"пользователь_{id}", int(админ))
+        )
+    global _доступ, _админы, _поколение_доступа
+    with _замок_доступа:
+        _доступ = _доступ | {id}
+        _админы = _админы | {id} if админ else _админы - {id}
+        _поколение_доступа += 1
+
+def загрузить_доступ():
+    # Как и с расценками: если пока шла выборка, добавить_пользователя
+    # успел поменять множества, старый снимок не записываем — его
+    # подхватит следующая загрузка.
+    global _доступ, _админы, _доступ_загружен_в
+    поколение = _поколение_доступа
+    with _пул().чтение() as соединение:
+        строки = соединение.execute("SELECT id, админ FROM пользователи").fetchall()
+    with _замок_доступа:
+        if поколение == _поколение_доступа:
+            _доступ = frozenset(id for id, _ in строки)
+            _админы = frozenset(id for id, админ in строки if админ)
+            _доступ_загружен_в = time.monotonic()
+
+def кэш_доступа_свежий() -> bool:
+    return _доступ_загружен_в is not None and time.monotonic() - _доступ_загружен_в < ВРЕМЯ_ЖИЗНИ_ДОСТУПА
 
 def проверить_доступ(id: int) -> bool:
-    соединение = sqlite3.connect(ИМЯ_БАЗЫ)
-    курсор = соединение.cursor()
-    курсор.execute("SELECT 1 FROM пользователи WHERE id = ?", (id,))
-    return курсор.fetchone() is not None
+    if not кэш_доступа_свежий():
+        загрузить_доступ()
+    return id in _доступ
 
 def проверить_админа(id: int) -> bool:
-    соединение = sqlite3.connect(ИМЯ_БАЗЫ)
-    курсор = соединение.cursor()
-    курсор.execute("SELECT админ FROM пользователи WHERE id = ?", (id,))
-    строка = курсор.fetchone()
-    return bool(строка[0]) if строка else False
+    if not кэш_доступа_свежий():
+        загрузить_доступ()
+    return id in _админы
 
 def установить_расценку(код: str, ставка: float, единица: str = "шт"):
-    соединение = sqlite3.connect(ИМЯ_БАЗЫ)
-    курсор = соединение.cursor()
-    курсор.execute(
-        "INSERT OR REPLACE INTO расценки (код, ставка, единица) VALUES (?, ?, ?)",
-        (код, ставка, единица)
-    )
-    соединение.commit()
-    соединение.close()
+    with _пул().запись() as соединение:
+        соединение.execute(
+            "INSERT OR REPLACE INTO расценки (код, ставка, единица) VALUES (?, ?, ?)",
+            (код, ставка, единица)
+        )
+    сбросить_кэш_расценок()
+    сбросить_кэш_статистики()
+
+def сбросить_кэш_расценок():
+    global _кэш_расценок, _поколение_расценок
+    with _замок_расценок:
+        _кэш_расценок = None
+        _поколение_расценок += 1
+
+def кэш_расценок_загружен() -> bool:
+    return _кэш_расценок is not None
+
+def _расценки() -> dict:
+    global _кэш_расценок
+    кэш = _кэш_расценок
+    if кэш is not None:
+        return кэш
+    поколение = _поколение_расценок
+    with _пул().чтение() as соединение:
+        строки = соединение.execute("SELECT код, ставка, единица FROM расценки").fetchall()
+    кэш = {код: (ставка, единица) for код, ставка, единица in строки}
+    with _замок_расценок:
+        if поколение == _поколение_расценок:
+            _кэш_расценок = кэш
+    return кэш
 
 def получить_расценку(код: str):
-    соединение = sqlite3.connect(ИМЯ_БАЗЫ)
-    курсор = соединение.cursor()
-    курсор.execute("SELECT ставка, единица FROM расценки WHERE код = ?", (код,))
-    return курсор.fetchone()
+    return _расценки().get(код)
 
 def получить_все_расценки():
-    соединение = sqlite3.connect(ИМЯ_БАЗЫ)
-    курсор = соединение.cursor()
-    курсор.execute("SELECT код, ставка, единица FROM расценки")
-    return курсор.fetchall()
-
-def добавить_работу(пользователь_id: int, имя: str, код_операции: str, количество: float = 1):
-    соединение = sqlite3.connect(ИМЯ_БАЗЫ)
-    курсор = соединение.cursor()
-    курсор.execute(
-        "INSERT INTO работы (пользователь_id, имя, код_операции, количество, дата) VALUES (?, ?, ?, ?, ?)",
-        (пользователь_id, имя, код_операции, количество, datetime.now().isoformat())
-    )
-    соединение.commit()
-    соединение.close()
+    return [(код, ставка, единица) for код, (ставка, единица) in _расценки().items()]
+
+def добавить_работу(пользователь_id: int, имя: str, код_операции: str, количество: float = 1) -> int:
+    return добавить_работы(пользователь_id, имя, [(код_операции, количество)])[0]
+
+def добавить_работы(пользователь_id: int, имя: str, позиции) -> list:
+    # Строки для Google Таблицы попадают в очередь той же транзакцией,
+    # поэтому работа не может потеряться между базой и таблицей.
+    # Позиции — список (код_операции, количество); все пишутся одним коммитом.
+    расценки = _расценки()
+    дата = datetime.now().isoformat()
+    работы = [(пользователь_id, имя, код, количество, дата) for код, количество in позиции]
+    with _пул().запись() as соединение:
+        соединение.executemany(
+            "INSERT INTO работы (пользователь_id, имя, код_операции, количество, дата) VALUES (?, ?, ?, ?, ?)",
+            работы
+        )
+        # Писатель один, поэтому id пачки идут подряд и заканчиваются последним вставленным.
+        последний = соединение.execute("SELECT last_insert_rowid()").fetchone()[0]
+        идентификаторы = list(range(последний - len(работы) + 1, последний + 1))
+        соединение.executemany(
+            _ОБНОВИТЬ_ИТОГИ,
+            [(пользователь_id, дата[:10], код, количество) for код, количество in позиции]
+        )
+        очередь = []
+        for работа_id, (код, количество) in zip(идентификаторы, позиции):
+            расценка = расценки.get(код)
+            ставка = расценка[0] if расценка else None
+            очередь.append((работа_id, ставка, количество * ставка if расценка else None))
+        соединение.executemany("INSERT INTO очередь_google (работа_id, ставка, сумма) VALUES (?, ?, ?)", очередь)
+    сбросить_кэш_статистики(дата[:10])
+    return идентификаторы
+
+# Строка, которую Google отверг столько раз подряд в одиночку, откладывается:
+# отправщик её больше не берёт, в таблицу её дописывает сверка.
+МАКС_ПОПЫТОК_GOOGLE = 10
+
+def получить_очередь_google(лимит: int = 100):
+    # Строки, которые уже не прошли, — после свежих: плохая строка не держит очередь.
+    with _пул().чтение() as соединение:
+        return соединение.execute("""
+            SELECT q.id, q.попыток, w.дата, w.имя, w.код_операции, w.количество, q.ставка, q.сумма, w.пользователь_id, w.id
+            FROM очередь_google q
+            JOIN работы w ON w.id = q.работа_id
+            WHERE q.попыток < ?
+            ORDER BY q.попыток, q.id
+            LIMIT ?
+        """, (МАКС_ПОПЫТОК_GOOGLE, лимит)).fetchall()
+
+ЗАПРОС_СВЕРКИ = """
+    SELECT w.дата, w.имя, w.код_операции, w.количество, r.ставка, w.количество * r.ставка, w.пользователь_id, w.id
+    FROM {таблица} w
+    LEFT JOIN расценки r ON w.код_операции = r.код
+    WHERE w.дата >= ? AND w.дата < ?
+      AND NOT EXISTS (SELECT 1 FROM очередь_google q WHERE q.работа_id = w.id AND q.попыток < ?)
+    ORDER BY w.дата
+"""
+
+def работы_для_сверки(с: str, по: str):
+    # Всё, что уже должно быть в таблице: работы из очереди ещё в пути,
+    # кроме отложенных — их отправщик уже не возьмёт. Закрытые месяцы
+    # берутся из архива, как и в экспорте.
+    # Ставка — текущая, исходная живёт только в очереди до отправки.
+    участки = участки_периода(с, по, архивные_месяцы())
+    работы = []
+    with _пул().чтение() as соединение:
+        for файл, кусок_с, кусок_по in участки:
+            with _таблица_работ(соединение, файл) as таблица:
+                работы += соединение.execute(
+                    ЗАПРОС_СВЕРКИ.format(таблица=таблица), (кусок_с, кусок_по, МАКС_ПОПЫТОК_GOOGLE)
+                ).fetchall()
+    return работы
+
+def удалить_из_очереди_google(идентификаторы):
+    with _пул().запись() as соединение:
+        соединение.executemany("DELETE FROM очередь_google WHERE id = ?", [(id,) for id in идентификаторы])
+
+def снять_отложенные_google(работы):
+    # Сверка дописала эти работы сама — отложенные строки больше не нужны.
+    with _пул().запись() as соединение:
+        соединение.executemany(
+            "DELETE FROM очередь_google WHERE работа_id = ? AND попыток >= ?",
+            [(id, МАКС_ПОПЫТОК_GOOGLE) for id in работы]
+        )
+
+def отметить_попытку_google(идентификаторы):
+    with _пул().запись() as соединение:
+        соединение.executemany(
+            "UPDATE очередь_google SET попыток = попыток + 1 WHERE id = ?",
+            [(id,) for id in идентификаторы]
+        )
 
 def получить_работы_до_сегодня(пользователь_id: int):
-    соединение = sqlite3.connect(ИМЯ_БАЗЫ)
-    курсор = соединение.cursor()
-    сейчас = datetime.now()
-    курсор.execute("""
-        SELECT код_операции, количество, дата
-        FROM работы
-        WHERE пользователь_id = ?
-          AND strftime('%Y', дата) = ?
-          AND strftime('%m', дата) = ?
-          AND CAST(strftime('%d', дата) AS INTEGER) <= ?
-        ORDER BY дата
-    """, (пользователь_id, str(сейчас.year), f"{сейчас.month:02d}", сейчас.day))
-    return курсор.fetchall()
-
-def экспорт_в_csv(месяц: int = None, год: int = None) -> str:
-    if месяц is None or год is None:
-        сейчас = datetime.now()
-        месяц = сейчас.month
-        год = сейчас.year
-
-    имя_файла = f"экспорт_{год}_{месяц:02d}.csv"
-    путь = os.path.join("exports", имя_файла)
-    os.makedirs("exports", exist_ok=True)
-
-    соединение = sqlite3.connect(ИМЯ_БАЗЫ)
-    курсор = соединение.cursor()
-    курсор.execute("""
-        SELECT w.дата, u.имя, w.код_операции, w.количество, r.ставка
-        FROM работы w
-        JOIN пользователи u ON w.пользователь_id = u.id
-        LEFT JOIN расценки r ON w.код_операции = r.код
-        WHERE strftime('%Y', w.дата) = ? AND strftime('%m', w.дата) = ?
-        ORDER BY w.дата
-    """, (str(год), f"{месяц:02d}"))
-
-    with open(путь, "w", newline="", encoding="utf-8") as f:
-        writer = csv.writer(f)
-        writer.writerow(["Дата", "Сотрудник", "Операция", "Кол-во", "Ставка", "Сумма"])
-        for строка in курсор.fetchall():
-            дата, имя, код, колво, ставка = строка
-            ставка = ставка or 0
-            сумма = колво * ставка
-            writer.writerow([дата[:19], имя, код, колво, ставка, round(сумма, 2)])
-
-    соединение.close()
-    return путь
\ No newline at end of file
+    сегодня = date.today()
+    с = сегодня.replace(day=1).isoformat()
+    по = (сегодня + timedelta(days=1)).isoformat()
+    with _пул().чтение() as соединение:
+        return соединение.execute(ЗАПРОС_РАБОТ_ПОЛЬЗОВАТЕЛЯ, (пользователь_id, с, по)).fetchall()
+
+def получить_отчёт_до_сегодня(пользователь_id: int):
+    # Одна выборка с подытогами по дням и операциям; сумма NULL — нет расценки.
+    сегодня = date.today()
+    с = сегодня.replace(day=1).isoformat()
+    по = (сегодня + timedelta(days=1)).isoformat()
+    with _пул().чтение() as соединение:
+        return соединение.execute(ЗАПРОС_ОТЧЁТА_ПОЛЬЗОВАТЕЛЯ, (пользователь_id, с, по)).fetchall()
+
+ЗАГОЛОВОК_ЭКСПОРТА = ["Дата", "Сотрудник", "Операция", "Кол-во", "Ставка", "Сумма"]
+РАЗМЕР_ПАЧКИ_ЭКСПОРТА = 1000
+# До этого размера экспорт живёт в памяти, дальше SpooledTemporaryFile
+# сам переносит его на диск, так что память не растёт с периодом.
+ПОРОГ_ЭКСПОРТА_В_ПАМЯТИ = 8 * 1024 * 1024
+
+def получить_сводку_по_операциям(с: str, по: str, пользователь_id: int = None):
+    фильтры = ""
+    параметры = [с, по]
+    if пользователь_id is not None:
+        фильтры = " AND i.пользователь_id = ?"
+        параметры.append(пользователь_id)
+    with _пул().чтение() as соединение:
+        return соединение.execute(ЗАПРОС_СВОДКИ_ПО_ОПЕРАЦИЯМ.format(фильтры=фильтры), параметры).fetchall()
+
+def проверить_итоги():
+    # Сравнивает итоги с пересчётом из сырых работ; возвращает расхождения
+    # в виде (пользователь_id, день, код, (количество, записей) в итогах, ... в работах).
+    with _пул().чтение() as соединение:
+        ожидаемые = {строка[:3]: строка[3:] for строка in соединение.execute(_ИТОГИ_ИЗ_РАБОТ)}
+        фактические = {
+            строка[:3]: строка[3:]
+            for строка in соединение.execute(
+                "SELECT пользователь_id, день, код_операции, количество, записей FROM итоги_по_дням "
+                f"WHERE substr(день, 1, 7) {_НЕ_В_АРХИВЕ}"
+            )
+        }
+    расхождения = []
+    for ключ in sorted(ожидаемые.keys() | фактические.keys()):
+        if not _итоги_совпадают(ожидаемые.get(ключ), фактические.get(ключ)):
+            расхождения.append((*ключ, фактические.get(ключ), ожидаемые.get(ключ)))
+    return расхождения
+
+def _итоги_совпадают(ожидаемые, фактические) -> bool:
+    # Итоги копятся по одной работе, а SUM() в SQLite ≥ 3.43 считает с
+    # компенсацией — дробные количества могут разойтись в последнем бите.
+    if ожидаемые is None or фактические is None:
+        return ожидаемые is фактические
+    (ожидается, записей), (есть, записано) = ожидаемые, фактические
+    return записей == записано and math.isclose(ожидается, есть, rel_tol=1e-9, abs_tol=1e-9)
+
+def перестроить_итоги() -> int:
+    with _пул().запись() as соединение:
+        соединение.execute(f"DELETE FROM итоги_по_дням WHERE substr(день, 1, 7) {_НЕ_В_АРХИВЕ}")
+        строк = соединение.execute(
+            "INSERT INTO итоги_по_дням (пользователь_id, день, код_операции, количество, записей) " + _ИТОГИ_ИЗ_РАБОТ
+        ).rowcount
+    сбросить_кэш_статистики()
+    return строк
+
+def сбросить_кэш_статистики(день: str = None):
+    # Без дня — сбросить всё; с днём — только периоды, которые его содержат.
+    global _поколение_статистики
+    with _замок_статистики:
+        for с, по in list(_кэш_статистики):
+            if день is None or с <= день < по:
+                del _кэш_статистики[(с, по)]
+        _поколение_статистики += 1
+
+def статистика_в_кэше(с: str, по: str) -> bool:
+    return (с, по) in _кэш_статистики
+
+def получить_статистику(с: str, по: str) -> dict:
+    статистика = _кэш_статистики.get((с, по))
+    if статистика is not None:
+        return статистика
+    поколение = _поколение_статистики
+    длина = date.fromisoformat(по) - date.fromisoformat(с)
+    шаг = 10 if длина <= timedelta(days=31) else 7 if длина <= timedelta(days=731) else 4
+    with _пул().чтение() as соединение:
+        операции = соединение.execute(ЗАПРОС_СВОДКИ_ПО_ОПЕРАЦИЯМ.format(фильтры=""), (с, по)).fetchall()
+        статистика = {
+            "лидеры": соединение.execute(ЗАПРОС_ЛИДЕРОВ, (с, по, ЛИДЕРОВ_В_СТАТИСТИКЕ)).fetchall(),
+            "операции": операции,
+            "динамика": соединение.execute(ЗАПРОС_ДИНАМИКИ, (шаг, с, по)).fetchall(),
+            # Работы без расценки в экспорте молча становятся нулём.
+            "без_расценки": [(код, колво, записей) for код, колво, записей, ставка, _ in операции if ставка is None],
+        }
+    with _замок_статистики:
+        if поколение == _поколение_статистики:
+            if len(_кэш_статистики) >= МАКС_ПЕРИОДОВ_СТАТИСТИКИ:
+                del _кэш_статистики[next(iter(_кэш_статистики))]
+            _кэш_статистики[(с, по)] = статистика
+    return статистика
+
+def выполненные_сроки(задача: str) -> set:
+    with _пул().чтение() as соединение:
+        return {срок for (срок,) in соединение.execute("SELECT срок FROM выполненные_задачи WHERE задача = ?", (задача,))}
+
+def отметить_выполнение(задача: str, срок: str):
+    with _пул().запись() as соединение:
+        соединение.execute(
+            "INSERT OR REPLACE INTO выполненные_задачи (задача, срок, выполнено) VALUES (?, ?, ?)",
+            (задача, срок, datetime.now().isoformat())
+        )
+
+def запрос_экспорта(пользователь_id: int = None, код_операции: str = None, таблица: str = "работы"):
+    фильтры = ""
+    параметры = []
+    if пользователь_id is not None:
+        фильтры += " AND w.пользователь_id = ?"
+        параметры.append(пользователь_id)
+    if код_операции is not None:
+        фильтры += " AND w.код_операции = ?"
+        параметры.append(код_операции)
+    return ЗАПРОС_ЭКСПОРТА.format(таблица=таблица, фильтры=фильтры), параметры
+
+def путь_архива(год: int) -> str:
+    основа, расширение = os.path.splitext(ИМЯ_БАЗЫ)
+    return f"{основа}_{год}{расширение or '.db'}"
+
+def архивные_месяцы() -> dict:
+    with _пул().чтение() as соединение:
+        return dict(соединение.execute("SELECT месяц, файл FROM архив_месяцев"))
+
+def участки_периода(с: str, по: str, архив: dict):
+    # Делит [с, по) по месяцам на куски [(файл или None, с, по)]: None —
+    # горячая таблица. Соседние месяцы из одного источника склеиваются.
+    участки = []
+    месяц = date.fromisoformat(с[:10]).replace(day=1)
+    while месяц.isoformat() < по:
+        следующий = (месяц + timedelta(days=32)).replace(day=1)
+        файл = архив.get(месяц.isoformat()[:7])
+        кусок_с = max(с, месяц.isoformat())
+        кусок_по = min(по, следующий.isoformat())
+        if участки and участки[-1][0] == файл:
+            участки[-1] = (файл, участки[-1][1], кусок_по)
+        else:
+            участки.append((файл, кусок_с, кусок_по))
+        месяц = следующий
+    return участки
+
+@contextmanager
+def _таблица_работ(соединение, файл: str = None):
+    # Закрытые месяцы читаются из годового архива, подключённого через
+    # ATTACH к тому же соединению: имена и расценки берутся из горячей базы.
+    if файл is None:
+        yield "работы"
+        return
+    соединение.execute("ATTACH DATABASE ? AS архив", (файл,))
+    try:
+        yield "архив.работы"
+    finally:
+        соединение.execute("DETACH DATABASE архив")
+
+def строки_экспорта(с: str, по: str, пользователь_id: int = None, код_операции: str = None):
+    участки = участки_периода(с, по, архивные_месяцы())
+    with _пул().чтение() as соединение:
+        for файл, кусок_с, кусок_по in участки:
+            with _таблица_работ(соединение, файл) as таблица:
+                запрос, параметры = запрос_экспорта(пользователь_id, код_операции, таблица)
+                курсор = соединение.execute(запрос, [кусок_с, кусок_по, *параметры])
+                try:
+                    while True:
+                        пачка = курсор.fetchmany(РАЗМЕР_ПАЧКИ_ЭКСПОРТА)
+                        if not пачка:
+                            break
+                        for дата, имя, код, колво, ставка in пачка:
+                            ставка = ставка or 0
+                            yield [дата[:19], имя, код, колво, ставка, round(колво * ставка, 2)]
+                finally:
+                    курсор.close()
+
+def экспорт_в_csv(месяц: int = None, год: int = None, *, с: str = None, по: str = None,
+                  пользователь_id: int = None, код_операции: str = None, сжать: bool = False):
+    # Возвращает (файл, имя_файла); файл открыт и перемотан в начало.
+    if с is None or по is None:
+        if месяц is None or год is None:
+            сейчас = datetime.now()
+            месяц = сейчас.month
+            год = сейчас.year
+        с, по = границы_месяца(год, месяц)
+        имя_файла = f"экспорт_{год}_{месяц:02d}"
+    else:
+        имя_файла = f"экспорт_{с}_{по}"
+    if пользователь_id is not None:
+        имя_файла += f"_{пользователь_id}"
+    if код_операции is not None:
+        имя_файла += f"_{код_операции}"
+    имя_файла += ".csv.gz" if сжать else ".csv"
+
+    буфер = tempfile.SpooledTemporaryFile(max_size=ПОРОГ_ЭКСПОРТА_В_ПАМЯТИ)
+    поток = gzip.GzipFile(fileobj=буфер, mode="wb") if сжать else буфер
+    текст = io.TextIOWrapper(поток, encoding="utf-8", newline="")
+    writer = csv.writer(текст)
+    writer.writerow(ЗАГОЛОВОК_ЭКСПОРТА)
+    for строка in строки_экспорта(с, по, пользователь_id, код_операции):
+        writer.writerow(строка)
+    текст.flush()
+    текст.detach()
+    if сжать:
+        поток.close()
+    буфер.seek(0)
+    return буфер, имя_файла
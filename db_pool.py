@@ -0,0 +1,95 @@
+import sqlite3
+import threading
+import queue
+from contextlib import contextmanager
+
+# Один писатель и несколько читателей на каждый файл базы.
+# WAL позволяет читать параллельно с записью, а долгоживущие
+# соединения сохраняют кэш подготовленных выражений между запросами.
+ЧИСЛО_ЧИТАТЕЛЕЙ = 4
+КЭШ_ВЫРАЖЕНИЙ = 128
+ТАЙМАУТ_БЛОКИРОВКИ = 5.0
+
+def _открыть(путь: str, только_чтение: bool = False) -> sqlite3.Connection:
+    соединение = sqlite3.connect(
+        путь,
+        timeout=ТАЙМАУТ_БЛОКИРОВКИ,
+        check_same_thread=False,
+        cached_statements=КЭШ_ВЫРАЖЕНИЙ,
+    )
+    соединение.execute("PRAGMA journal_mode=WAL")
+    соединение.execute("PRAGMA synchronous=NORMAL")
+    соединение.execute(f"PRAGMA busy_timeout={int(ТАЙМАУТ_БЛОКИРОВКИ * 1000)}")
+    if только_чтение:
+        соединение.isolation_level = None
+        соединение.execute("PRAGMA query_only=ON")
+    return соединение
+
+class Пул:
+    def __init__(self, путь: str, читателей: int = ЧИСЛО_ЧИТАТЕЛЕЙ):
+        self.путь = путь
+        self._писатель = _открыть(путь)
+        self._замок_записи = threading.Lock()
+        self._читатели = queue.LifoQueue()
+        self._всего_читателей = 0
+        self._лимит_читателей = читателей
+        self._замок_читателей = threading.Lock()
+        self.открыто_соединений = 1
+
+    def _взять_читателя(self) -> sqlite3.Connection:
+        try:
+            return self._читатели.get_nowait()
+        except queue.Empty:
+            pass
+        with self._замок_читателей:
+            if self._всего_читателей < self._лимит_читателей:
+                self._всего_читателей += 1
+                self.открыто_соединений += 1
+                return _открыть(self.путь, только_чтение=True)
+        return self._читатели.get()
+
+    @contextmanager
+    def чтение(self):
+        соединение = self._взять_читателя()
+        try:
+            yield соединение
+        finally:
+            self._читатели.put(соединение)
+
+    @contextmanager
+    def запись(self):
+        with self._замок_записи:
+            try:
+                yield self._писатель
+                self._писатель.commit()
+            except BaseException:
+                self._писатель.rollback()
+                raise
+
+    def закрыть(self):
+        with self._замок_записи:
+            self._писатель.close()
+        while True:
+            try:
+                self._читатели.get_nowait().close()
+            except queue.Empty:
+                break
+
+_пулы = {}
+_замок_пулов = threading.Lock()
+
+def получить_пул(путь: str) -> Пул:
+    пул = _пулы.get(путь)
+    if пул is None:
+        with _замок_пулов:
+            пул = _пулы.get(путь)
+            if пул is None:
+                пул = Пул(путь)
+                _пулы[путь] = пул
+    return пул
+
+def закрыть_все():
+    with _замок_пулов:
+        for пул in _пулы.values():
+            пул.закрыть()
+        _пулы.clear()
@@ -0,0 +1,138 @@
+import asyncio
+import itertools
+import threading
+import time
+from collections import Counter
+from telegram import Document
+from telegram._utils.files import parse_file_input
+
+# Минимальные заменители объектов python-telegram-bot для прогона
+# обработчиков без сети: у них ровно те поля и методы, которые
+# вызывают обработчики в bot.py. Всё отправленное складывается в списки.
+
+class ФейковыйБот:
+    def __init__(self, задержка: float = 0.0):
+        self.задержка = задержка
+        self.сообщения = []
+        self.документы = []
+
+    async def send_message(self, chat_id, text, **kwargs):
+        await asyncio.sleep(self.задержка)
+        self.сообщения.append((chat_id, text))
+
+    async def send_document(self, chat_id, document, filename=None, caption=None, **kwargs):
+        # Разбираем документ так же, как PTB: то, что он отвергнет, падает и здесь.
+        документ = parse_file_input(document, Document, filename=filename)
+        await asyncio.sleep(self.задержка)
+        self.документы.append((chat_id, документ.filename, len(документ.input_file_content)))
+
+class ФейковыйПользователь:
+    def __init__(self, id: int, username: str = None):
+        self.id = id
+        self.username = username
+
+class ФейковоеСообщение:
+    def __init__(self, бот: ФейковыйБот, chat_id: int, text: str = None):
+        self.бот = бот
+        self.chat_id = chat_id
+        self.text = text
+        self.ответы = []
+
+    async def reply_text(self, text, **kwargs):
+        await asyncio.sleep(self.бот.задержка)
+        self.ответы.append(text)
+
+    async def reply_document(self, document, filename=None, caption=None, **kwargs):
+        await self.бот.send_document(self.chat_id, document, filename=filename, caption=caption)
+        self.ответы.append(caption)
+
+class ФейковыйЗапрос:
+    def __init__(self, бот: ФейковыйБот, data: str):
+        self.бот = бот
+        self.data = data
+        self.ответы = []
+
+    async def answer(self, *args, **kwargs):
+        await asyncio.sleep(self.бот.задержка)
+
+    async def edit_message_text(self, text, **kwargs):
+        await asyncio.sleep(self.бот.задержка)
+        self.ответы.append(text)
+
+class ФейковоеОбновление:
+    def __init__(self, пользователь: ФейковыйПользователь, message: ФейковоеСообщение = None,
+                 callback_query: ФейковыйЗапрос = None):
+        self.effective_user = пользователь
+        self.message = message
+        self.callback_query = callback_query
+
+class ФейковыйКонтекст:
+    def __init__(self, бот: ФейковыйБот, bot_data: dict, user_data: dict = None, args=None):
+        self.bot = бот
+        self.bot_data = bot_data
+        self.user_data = {} if user_data is None else user_data
+        self.args = args or []
+
+def команда(бот, bot_data, user_data, пользователь, текст: str):
+    части = текст.split()
+    сообщение = ФейковоеСообщение(бот, пользователь.id, текст)
+    return (
+        ФейковоеОбновление(пользователь, message=сообщение),
+        ФейковыйКонтекст(бот, bot_data, user_data, части[1:] if части[0].startswith("/") else None),
+    )
+
+def нажатие(бот, bot_data, user_data, пользователь, data: str):
+    return (
+        ФейковоеОбновление(пользователь, callback_query=ФейковыйЗапрос(бот, data)),
+        ФейковыйКонтекст(бот, bot_data, user_data),
+    )
+
+# Заглушка HTTP Bot API для прогона настоящего Application без Telegram:
+# config.АДРЕС_BOT_API = "http://127.0.0.1:8081" направляет туда getMe,
+# ответы обработчиков и setWebhook. Любой send*/edit* получает в ответ
+# правдоподобное сообщение, остальные методы — True.
+БОТ_ЗАГЛУШКИ = {"id": 1, "is_bot": True, "first_name": "Патриот-М", "username": "patriot_offline_bot"}
+
+class ФейковыйBotAPI:
+    def __init__(self):
+        self.вызовы = Counter()
+        self._номера = itertools.count(1)
+        self._замок = threading.Lock()
+
+    def ответ(self, метод: str, параметры: dict):
+        with self._замок:
+            self.вызовы[метод] += 1
+            номер = next(self._номера)
+        if метод == "getMe":
+            return БОТ_ЗАГЛУШКИ
+        if метод == "getUpdates":
+            return []
+        if метод.startswith(("send", "edit", "copy", "forward")):
+            chat_id = int(параметры.get("chat_id") or 0)
+            return {
+                "message_id": номер,
+                "date": int(time.time()),
+                "chat": {"id": chat_id, "type": "private"},
+                "from": БОТ_ЗАГЛУШКИ,
+                "text": параметры.get("text") or "",
+            }
+        return True
+
+    def создать_flask_приложение(self):
+        from flask import Flask, jsonify, request
+
+        flask_app = Flask(__name__)
+
+        # Имена переменных в правилах werkzeug — только латиница.
+        @flask_app.route("/bot<token>/<method>", methods=["GET", "POST"])
+        def метод_api(token, method):
+            return jsonify({"ok": True, "result": self.ответ(method, request.values.to_dict())})
+
+        return flask_app
+
+    def запустить(self, хост: str = "127.0.0.1", порт: int = 8081):
+        from werkzeug.serving import make_server
+
+        сервер = make_server(хост, порт, self.создать_flask_приложение(), threaded=True)
+        threading.Thread(target=сервер.serve_forever, name="фейковый-bot-api", daemon=True).start()
+        return сервер
@@ -0,0 +1,332 @@
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+import types
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+import database
+import db_pool
+
+# Офлайн-нагрузка на обработчики бота: синтетическая works.db,
+# фейковые Update/CallbackQuery вместо Telegram и параллельные
+# «работники», которые проходят /add целиком и шлют /me, /rates, /export.
+#
+#   python loadtest.py generate bench.db --users 200 --rates 40 --rows 2000000 --years 3
+#   python loadtest.py run --db bench.db --workers 50 --iterations 20
+#
+# Режим вебхука с настоящим Application — через HTTP и заглушку Bot API:
+#   python loadtest.py bot-api --port 8081      (в config.py: АДРЕС_BOT_API = "http://127.0.0.1:8081",
+#                                                РЕЖИМ_ЗАПУСКА = "webhook", ВЕБХУК_СЕКРЕТ, без ВЕБХУК_URL)
+#   python bot.py
+#   python loadtest.py webhook --db works.db --secret СЕКРЕТ --workers 20 --iterations 10
+
+КОДЫ = [
+    "sw_rama_8", "sw_kal_qr", "paj_reg_kond_sil", "paj_reg_kond_sil_mot",
+    "paj_polt_kript_tep_kam_vtx", "paj_polt_kript_tep_kam_rasp_vtx", "sb_dron", "obletka",
+]
+АДМИН_ID = 1
+ПАЧКА_ВСТАВКИ = 50_000
+
+def коды_операций(расценок: int) -> list:
+    # Сначала настоящие операции, дальше синтетические synth_N.
+    return КОДЫ[:расценок] + [f"synth_{i}" for i in range(1, расценок - len(КОДЫ) + 1)]
+
+def сгенерировать_базу(путь: str, пользователей: int, строк: int, лет: int, seed: int = 1,
+                       расценок: int = len(КОДЫ)):
+    rng = random.Random(seed)
+    коды = коды_операций(расценок)
+    database.ИМЯ_БАЗЫ = путь
+    database.инициализировать_базу()
+    database.добавить_пользователя(АДМИН_ID, "админ", админ=True)
+    for id in range(2, пользователей + 1):
+        database.добавить_пользователя(id, f"работник_{id}")
+    for код in коды:
+        database.установить_расценку(код, rng.choice([50, 80, 120, 250, 400, 900]))
+
+    конец = datetime.now()
+    начало = конец - timedelta(days=365 * лет)
+    шаг = (конец - начало) / строк
+    for смещение in range(0, строк, ПАЧКА_ВСТАВКИ):
+        пачка = []
+        for i in range(смещение, min(смещение + ПАЧКА_ВСТАВКИ, строк)):
+            id = rng.randint(1, пользователей)
+            пачка.append((id, f"работник_{id}", rng.choice(коды), rng.randint(1, 20), (начало + шаг * i).isoformat()))
+        with database._пул().запись() as соединение:
+            соединение.executemany(
+                "INSERT INTO работы (пользователь_id, имя, код_операции, количество, дата) VALUES (?, ?, ?, ?, ?)",
+                пачка
+            )
+    database.перестроить_итоги()
+
+def _подключить_конфиг():
+    # Для офлайн-прогона config.py с токенами не нужен.
+    try:
+        import config  # noqa: F401
+    except ImportError:
+        config = types.ModuleType("config")
+        config.ТОКЕН_БОТА = "offline"
+        config.ВЛАДЕЛЕЦ_ID = АДМИН_ID
+        config.ПОЛУЧАТЕЛЬ_ОТЧЁТОВ_ID = АДМИН_ID
+        config.GOOGLE_SHEET_ID = "offline"
+        config.GOOGLE_CREDENTIALS_FILE = "offline.json"
+        sys.modules["config"] = config
+
+class ФейковыйЛист:
+    def __init__(self):
+        self.строки = []
+
+    def row_values(self, номер):
+        return self.строки[номер - 1] if len(self.строки) >= номер else []
+
+    def append_row(self, строка, **kwargs):
+        self.строки.append(строка)
+
+    def append_rows(self, строки, **kwargs):
+        self.строки.extend(строки)
+
+    def update_cell(self, строка, столбец, значение):
+        while len(self.строки) < строка:
+            self.строки.append([])
+        ряд = self.строки[строка - 1]
+        ряд.extend([""] * (столбец - len(ряд)))
+        ряд[столбец - 1] = значение
+
+    def get_all_values(self):
+        # Как в gspread: всё строками.
+        return [["" if значение is None else str(значение) for значение in строка] for строка in self.строки]
+
+class Замеры:
+    def __init__(self):
+        self.задержки = {}
+        self.ошибки = {}
+
+    async def замерить(self, имя, обработчик, update, context):
+        начало = time.perf_counter()
+        try:
+            результат = await обработчик(update, context)
+            # Обработчики сами ловят исключения и отвечают «❌ …» — это тоже ошибка.
+            источник = update.message or update.callback_query
+            if any((ответ or "").startswith("❌") for ответ in источник.ответы):
+                self.ошибки[имя] = self.ошибки.get(имя, 0) + 1
+            return результат
+        except Exception:
+            self.ошибки[имя] = self.ошибки.get(имя, 0) + 1
+        finally:
+            self.задержки.setdefault(имя, []).append(time.perf_counter() - начало)
+
+    def отчёт(self, длительность: float) -> str:
+        строки = [f"{'обработчик':<22}{'вызовов':>9}{'ошибок':>8}{'p50 мс':>10}{'p95 мс':>10}{'p99 мс':>10}"]
+        всего = 0
+        for имя, задержки in sorted(self.задержки.items()):
+            задержки = sorted(задержки)
+            всего += len(задержки)
+            квантиль = lambda q: задержки[min(len(задержки) - 1, int(len(задержки) * q))] * 1000
+            строки.append(
+                f"{имя:<22}{len(задержки):>9}{self.ошибки.get(имя, 0):>8}"
+                f"{statistics.median(задержки) * 1000:>10.2f}{квантиль(0.95):>10.2f}{квантиль(0.99):>10.2f}"
+            )
+        строки.append(f"всего {всего} вызовов за {длительность:.2f} с — {всего / длительность:.1f} обновлений/с")
+        return "\n".join(строки)
+
+async def _работник(bot, ft, замеры, бот, bot_data, пользователь, итераций, rng, доли, коды):
+    user_data = {}
+    for _ in range(итераций):
+        await замеры.замерить("начать_добавление", bot.начать_добавление,
+                              *ft.команда(бот, bot_data, user_data, пользователь, "/add"))
+        await замеры.замерить("выбрать_операцию", bot.выбрать_операцию,
+                              *ft.нажатие(бот, bot_data, user_data, пользователь, f"op_{rng.choice(коды)}"))
+        await замеры.замерить("ввести_количество", bot.ввести_количество,
+                              *ft.команда(бот, bot_data, user_data, пользователь, str(rng.randint(1, 10))))
+        if rng.random() < доли["me"]:
+            await замеры.замерить("моя_зп_сегодня", bot.моя_зп_сегодня,
+                                  *ft.команда(бот, bot_data, user_data, пользователь, "/me"))
+        if rng.random() < доли["rates"]:
+            await замеры.замерить("список_расценок", bot.список_расценок,
+                                  *ft.команда(бот, bot_data, user_data, пользователь, "/rates"))
+
+async def _админ(bot, ft, замеры, бот, bot_data, экспортов, rng):
+    админ = ft.ФейковыйПользователь(АДМИН_ID, "админ")
+    for _ in range(экспортов):
+        await замеры.замерить("экспорт_команда", bot.экспорт_команда,
+                              *ft.команда(бот, bot_data, {}, админ, "/export"))
+        await asyncio.sleep(rng.random() * 0.5)
+
+async def прогнать(работников: int, итераций: int, экспортов: int, задержка_сети: float, seed: int = 1):
+    _подключить_конфиг()
+    import bot
+    import fake_telegram as ft
+    from notifications import ДиспетчерУведомлений
+    from sheets import запустить_отправку_в_google
+
+    database.загрузить_доступ()
+    rng = random.Random(seed)
+    бот = ft.ФейковыйБот(задержка_сети)
+    уведомления = ДиспетчерУведомлений(бот, АДМИН_ID)
+    bot_data = {"уведомления": уведомления}
+    остановка = asyncio.Event()
+    фоновые = [
+        asyncio.create_task(уведомления.запустить()),
+        asyncio.create_task(запустить_отправку_в_google(открыть=ФейковыйЛист, остановка=остановка)),
+    ]
+    with database._пул().чтение() as соединение:
+        ids = [id for (id,) in соединение.execute("SELECT id FROM пользователи WHERE id != ?", (АДМИН_ID,))]
+    доли = {"me": 0.3, "rates": 0.1}
+    коды = [код for код, _, _ in database.получить_все_расценки()]
+    замеры = Замеры()
+    начало = time.perf_counter()
+    await asyncio.gather(
+        *(
+            _работник(bot, ft, замеры, бот, bot_data, ft.ФейковыйПользователь(ids[i % len(ids)], f"работник_{ids[i % len(ids)]}"),
+                      итераций, random.Random(rng.random()), доли, коды)
+            for i in range(работников)
+        ),
+        _админ(bot, ft, замеры, бот, bot_data, экспортов, rng),
+    )
+    длительность = time.perf_counter() - начало
+    остановка.set()
+    уведомления.остановить()
+    await asyncio.gather(*фоновые, return_exceptions=True)
+    return замеры.отчёт(длительность)
+
+_номера_обновлений = itertools.count(1)
+
+def _обновление(пользователь_id: int, текст: str = None, данные: str = None) -> dict:
+    # JSON в том виде, в каком его POST-ит Telegram.
+    номер = next(_номера_обновлений)
+    отправитель = {"id": пользователь_id, "is_bot": False, "first_name": f"работник_{пользователь_id}",
+                   "username": f"работник_{пользователь_id}"}
+    чат = {"id": пользователь_id, "type": "private"}
+    if данные is not None:
+        сообщение = {"message_id": номер, "date": int(time.time()), "chat": чат, "text": "Выберите операцию:"}
+        return {"update_id": номер, "callback_query": {
+            "id": str(номер), "from": отправитель, "chat_instance": str(пользователь_id),
+            "data": данные, "message": сообщение,
+        }}
+    сообщение = {"message_id": номер, "date": int(time.time()), "chat": чат, "from": отправитель, "text": текст}
+    if текст.startswith("/"):
+        сообщение["entities"] = [{"type": "bot_command", "offset": 0, "length": len(текст.split()[0])}]
+    return {"update_id": номер, "message": сообщение}
+
+def прогнать_вебхук(url: str, секрет: str, пользователи: list, коды: list, работников: int, итераций: int,
+                    пауза: float, seed: int = 1):
+    # Замеряет приём обновления вебхуком; время самих обработчиков — в /metrics бота.
+    замеры = Замеры()
+
+    def отправить(имя: str, данные: dict):
+        запрос = urllib.request.Request(url, data=json.dumps(данные).encode(), headers={
+            "Content-Type": "application/json", "X-Telegram-Bot-Api-Secret-Token": секрет,
+        })
+        начало = time.perf_counter()
+        try:
+            with urllib.request.urlopen(запрос, timeout=30) as ответ:
+                ответ.read()
+        except (urllib.error.URLError, OSError):
+            замеры.ошибки[имя] = замеры.ошибки.get(имя, 0) + 1
+        finally:
+            замеры.задержки.setdefault(имя, []).append(time.perf_counter() - начало)
+        time.sleep(пауза)
+
+    def работник(номер: int):
+        rng = random.Random(seed + номер)
+        пользователь_id = пользователи[номер % len(пользователи)]
+        for _ in range(итераций):
+            # Пауза между шагами: при concurrent_updates шаги одного диалога иначе обгоняют друг друга.
+            отправить("/add", _обновление(пользователь_id, "/add"))
+            отправить("op_", _обновление(пользователь_id, данные=f"op_{rng.choice(коды)}"))
+            отправить("количество", _обновление(пользователь_id, str(rng.randint(1, 10))))
+            if rng.random() < 0.3:
+                отправить("/me", _обновление(пользователь_id, "/me"))
+
+    начало = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=работников) as исполнитель:
+        list(исполнитель.map(работник, range(работников)))
+    return замеры.отчёт(time.perf_counter() - начало)
+
+def main():
+    парсер = argparse.ArgumentParser(description="Офлайн-нагрузка на обработчики бота")
+    команды = парсер.add_subparsers(dest="команда", required=True)
+
+    генерация = команды.add_parser("generate", help="создать синтетическую works.db")
+    генерация.add_argument("db")
+    генерация.add_argument("--users", type=int, default=50)
+    генерация.add_argument("--rates", type=int, default=len(КОДЫ), help="число расценок; сверх восьми — синтетические коды")
+    генерация.add_argument("--rows", type=int, default=1_000_000)
+    генерация.add_argument("--years", type=int, default=3)
+    генерация.add_argument("--seed", type=int, default=1)
+
+    прогон = команды.add_parser("run", help="прогнать параллельные диалоги")
+    прогон.add_argument("--db", help="готовая база; без неё создаётся временная на 100 000 строк")
+    прогон.add_argument("--workers", type=int, default=20)
+    прогон.add_argument("--iterations", type=int, default=10)
+    прогон.add_argument("--exports", type=int, default=3)
+    прогон.add_argument("--latency", type=float, default=0.0, help="имитируемая задержка Telegram, с")
+    прогон.add_argument("--seed", type=int, default=1)
+
+    заглушка = команды.add_parser("bot-api", help="заглушка HTTP Bot API для config.АДРЕС_BOT_API")
+    заглушка.add_argument("--host", default="127.0.0.1")
+    заглушка.add_argument("--port", type=int, default=8081)
+
+    вебхук = команды.add_parser("webhook", help="POST-ить обновления в запущенный бот в режиме вебхука")
+    вебхук.add_argument("--db", required=True, help="works.db бота: из неё берутся пользователи и расценки")
+    вебхук.add_argument("--url", default="http://127.0.0.1:8443/telegram")
+    вебхук.add_argument("--secret", required=True)
+    вебхук.add_argument("--workers", type=int, default=20)
+    вебхук.add_argument("--iterations", type=int, default=10)
+    вебхук.add_argument("--pause", type=float, default=0.05, help="пауза между шагами диалога, с")
+    вебхук.add_argument("--seed", type=int, default=1)
+
+    аргументы = парсер.parse_args()
+    if аргументы.команда == "bot-api":
+        from fake_telegram import ФейковыйBotAPI
+
+        api = ФейковыйBotAPI()
+        сервер = api.запустить(аргументы.host, аргументы.port)
+        print(f"Заглушка Bot API: http://{аргументы.host}:{аргументы.port}")
+        try:
+            while True:
+                time.sleep(3600)
+        except KeyboardInterrupt:
+            сервер.shutdown()
+            print(dict(api.вызовы))
+        return
+    if аргументы.команда == "webhook":
+        database.ИМЯ_БАЗЫ = аргументы.db
+        with database._пул().чтение() as соединение:
+            пользователи = [id for (id,) in соединение.execute("SELECT id FROM пользователи WHERE админ = 0")]
+        коды = [код for код, _, _ in database.получить_все_расценки()]
+        db_pool.закрыть_все()
+        print(прогнать_вебхук(
+            аргументы.url, аргументы.secret, пользователи, коды,
+            аргументы.workers, аргументы.iterations, аргументы.pause, аргументы.seed
+        ))
+        return
+    if аргументы.команда == "generate":
+        начало = time.perf_counter()
+        сгенерировать_базу(аргументы.db, аргументы.users, аргументы.rows, аргументы.years, аргументы.seed, аргументы.rates)
+        db_pool.закрыть_все()
+        print(f"{аргументы.rows} строк за {time.perf_counter() - начало:.1f} с → {аргументы.db}")
+        return
+
+    with tempfile.TemporaryDirectory() as каталог:
+        if аргументы.db:
+            database.ИМЯ_БАЗЫ = аргументы.db
+            database.инициализировать_базу()
+        else:
+            сгенерировать_базу(os.path.join(каталог, "load.db"), 50, 100_000, 1, аргументы.seed)
+        print(asyncio.run(прогнать(
+            аргументы.workers, аргументы.iterations, аргументы.exports, аргументы.latency, аргументы.seed
+        )))
+        db_pool.закрыть_все()
+
+if __name__ == "__main__":
+    main()
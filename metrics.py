@@ -0,0 +1,221 @@
+import asyncio
+import functools
+import inspect
+import logging
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+# Лёгкие метрики без внешних зависимостей: гистограммы задержек и
+# счётчики ошибок по (вид, операция), задержка цикла событий и
+# выборочный профилировщик. Отдаются в текстовом формате Prometheus.
+ГРАНИЦЫ = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+ПОРОГ_МЕДЛЕННОГО = 1.0
+ИНТЕРВАЛ_ЦИКЛА = 0.5
+ИНТЕРВАЛ_ВЫБОРКИ = 0.01
+
+class Гистограмма:
+    def __init__(self):
+        self.корзины = [0] * (len(ГРАНИЦЫ) + 1)
+        self.сумма = 0.0
+        self.количество = 0
+
+    def добавить(self, значение: float):
+        for i, граница in enumerate(ГРАНИЦЫ):
+            if значение <= граница:
+                break
+        else:
+            i = len(ГРАНИЦЫ)
+        self.корзины[i] += 1
+        self.сумма += значение
+        self.количество += 1
+
+_замок = threading.Lock()
+_гистограммы = {}
+_ошибки = Counter()
+_задержка_цикла = 0.0
+
+def записать(вид: str, имя: str, секунд: float, ошибка: bool = False):
+    with _замок:
+        гистограмма = _гистограммы.get((вид, имя))
+        if гистограмма is None:
+            гистограмма = _гистограммы[(вид, имя)] = Гистограмма()
+        гистограмма.добавить(секунд)
+        if ошибка:
+            _ошибки[(вид, имя)] += 1
+    if вид == "handler" and секунд > ПОРОГ_МЕДЛЕННОГО:
+        logger.warning(f"Медленное обновление: {имя} — {секунд:.2f} с")
+
+@contextmanager
+def замер(вид: str, имя: str):
+    начало = time.perf_counter()
+    ошибка = False
+    try:
+        yield
+    except BaseException:
+        ошибка = True
+        raise
+    finally:
+        записать(вид, имя, time.perf_counter() - начало, ошибка)
+
+def замерено(вид: str, имя: str = None):
+    def декоратор(функция):
+        метка = имя or функция.__name__
+        if inspect.iscoroutinefunction(функция):
+            @functools.wraps(функция)
+            async def обёртка(*args, **kwargs):
+                with замер(вид, метка):
+                    return await функция(*args, **kwargs)
+        else:
+            @functools.wraps(функция)
+            def обёртка(*args, **kwargs):
+                with замер(вид, метка):
+                    return функция(*args, **kwargs)
+        return обёртка
+    return декоратор
+
+def инструментировать_модуль(модуль, вид: str, использует: str = None):
+    # Оборачивает публичные функции модуля на месте, так что замеряются
+    # и вызовы изнутри самого модуля. Генераторы не трогаем: их время
+    # уходит на итерацию, а не на вызов. С использует="_пул" берутся только
+    # функции, которые сами обращаются к этому имени или к генератору, который
+    # обращается (экспорт читает базу в строки_экспорта), — проверки кэшей
+    # и вспомогательные функции не разбавляют гистограммы.
+    функции = {
+        имя: объект for имя, объект in vars(модуль).items()
+        if inspect.isfunction(объект) and объект.__module__ == модуль.__name__
+    }
+    генераторы = {
+        имя for имя, объект in функции.items()
+        if inspect.isgeneratorfunction(объект) and (использует is None or использует in объект.__code__.co_names)
+    }
+    for имя, объект in функции.items():
+        if (
+            имя.startswith("_")
+            or inspect.isgeneratorfunction(объект)
+            or getattr(объект, "_замерено", False)
+        ):
+            continue
+        if использует is not None:
+            имена = set(объект.__code__.co_names)
+            if использует not in имена and not имена & генераторы:
+                continue
+        обёртка = замерено(вид, имя)(объект)
+        обёртка._замерено = True
+        setattr(модуль, имя, обёртка)
+
+async def следить_за_циклом(остановка: asyncio.Event):
+    global _задержка_цикла
+    цикл = asyncio.get_running_loop()
+    while not остановка.is_set():
+        начало = цикл.time()
+        await asyncio.sleep(ИНТЕРВАЛ_ЦИКЛА)
+        _задержка_цикла = max(0.0, цикл.time() - начало - ИНТЕРВАЛ_ЦИКЛА)
+        записать("loop", "lag", _задержка_цикла)
+
+class Профилировщик:
+    # Выборочный профилировщик: фоновый поток снимает стек потока цикла
+    # событий раз в ИНТЕРВАЛ_ВЫБОРКИ и копит свёрнутые стеки
+    # (формат flamegraph.pl). Включается только по запросу.
+    def __init__(self):
+        self.стеки = Counter()
+        self._поток = None
+        self._стоп = threading.Event()
+        self._цель = None
+
+    @property
+    def включён(self) -> bool:
+        return self._поток is not None
+
+    def включить(self, поток_id: int = None):
+        if self.включён:
+            return
+        self._цель = поток_id or threading.main_thread().ident
+        self.стеки.clear()
+        self._стоп.clear()
+        self._поток = threading.Thread(target=self._собирать, name="профилировщик", daemon=True)
+        self._поток.start()
+
+    def выключить(self) -> str:
+        if self.включён:
+            self._стоп.set()
+            self._поток.join()
+            self._поток = None
+        return self.свёрнутые_стеки()
+
+    def _собирать(self):
+        while not self._стоп.wait(ИНТЕРВАЛ_ВЫБОРКИ):
+            кадр = sys._current_frames().get(self._цель)
+            стек = []
+            while кадр is not None:
+                код = кадр.f_code
+                стек.append(f"{код.co_filename.rsplit('/', 1)[-1]}:{код.co_name}")
+                кадр = кадр.f_back
+            if стек:
+                self.стеки[";".join(reversed(стек))] += 1
+
+    def свёрнутые_стеки(self) -> str:
+        return "\n".join(f"{стек} {n}" for стек, n in self.стеки.most_common())
+
+профилировщик = Профилировщик()
+
+def _метки(вид: str, имя: str) -> str:
+    return f'kind="{вид}",op="{имя}"'
+
+def текст_prometheus() -> str:
+    строки = [
+        "# HELP patriot_latency_seconds Задержка операций по видам: handler, db, sheets, loop.",
+        "# TYPE patriot_latency_seconds histogram",
+    ]
+    with _замок:
+        гистограммы = {ключ: (list(г.корзины), г.сумма, г.количество) for ключ, г in _гистограммы.items()}
+        ошибки = dict(_ошибки)
+    for (вид, имя), (корзины, сумма, количество) in sorted(гистограммы.items()):
+        метки = _метки(вид, имя)
+        накоплено = 0
+        for граница, n in zip(ГРАНИЦЫ, корзины):
+            накоплено += n
+            строки.append(f'patriot_latency_seconds_bucket{{{метки},le="{граница}"}} {накоплено}')
+        строки.append(f'patriot_latency_seconds_bucket{{{метки},le="+Inf"}} {количество}')
+        строки.append(f"patriot_latency_seconds_sum{{{метки}}} {сумма}")
+        строки.append(f"patriot_latency_seconds_count{{{метки}}} {количество}")
+    строки += ["# HELP patriot_errors_total Число операций, завершившихся исключением.", "# TYPE patriot_errors_total counter"]
+    for (вид, имя), n in sorted(ошибки.items()):
+        строки.append(f"patriot_errors_total{{{_метки(вид, имя)}}} {n}")
+    строки += [
+        "# HELP patriot_event_loop_lag_seconds Последняя измеренная задержка цикла событий.",
+        "# TYPE patriot_event_loop_lag_seconds gauge",
+        f"patriot_event_loop_lag_seconds {_задержка_цикла}",
+    ]
+    return "\n".join(строки) + "\n"
+
+def создать_flask_приложение(flask_app=None):
+    from flask import Flask, Response, request
+
+    flask_app = flask_app or Flask(__name__)
+
+    @flask_app.get("/metrics")
+    def метрики():
+        return Response(текст_prometheus(), mimetype="text/plain; version=0.0.4")
+
+    @flask_app.post("/profile")
+    def профиль():
+        if request.args.get("action") == "stop":
+            return Response(профилировщик.выключить(), mimetype="text/plain")
+        профилировщик.включить()
+        return Response("profiling\n", mimetype="text/plain")
+
+    return flask_app
+
+def запустить_сервер(хост: str, порт: int):
+    # Отдельный поток с werkzeug; возвращает сервер, чтобы его можно было shutdown().
+    from werkzeug.serving import make_server
+
+    сервер = make_server(хост, порт, создать_flask_приложение(), threaded=True)
+    threading.Thread(target=сервер.serve_forever, name="метрики", daemon=True).start()
+    logger.info(f"Метрики: http://{хост}:{порт}/metrics")
+    return сервер
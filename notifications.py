@@ -0,0 +1,107 @@
+import asyncio
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+# Режимы: "digest" — склеивать всплески в одно сообщение за окно,
+# "immediate" — каждое уведомление отдельно, но всё равно через лимитер.
+РЕЖИМ_ПО_УМОЛЧАНИЮ = "digest"
+ОКНО_СКЛЕЙКИ = 30
+# Telegram допускает около 20 сообщений в минуту в один чат.
+ЁМКОСТЬ_ВЕДРА = 3
+СООБЩЕНИЙ_В_СЕКУНДУ = 20 / 60
+СТРОК_В_СВОДКЕ = 15
+
+class ТокенноеВедро:
+    def __init__(self, ёмкость: float, в_секунду: float, часы=time.monotonic):
+        self.ёмкость = ёмкость
+        self.в_секунду = в_секунду
+        self.часы = часы
+        self.токены = ёмкость
+        self.обновлено = часы()
+
+    def _пополнить(self):
+        сейчас = self.часы()
+        self.токены = min(self.ёмкость, self.токены + (сейчас - self.обновлено) * self.в_секунду)
+        self.обновлено = сейчас
+
+    async def взять(self):
+        while True:
+            self._пополнить()
+            if self.токены >= 1:
+                self.токены -= 1
+                return
+            await asyncio.sleep((1 - self.токены) / self.в_секунду)
+
+class Уведомление:
+    def __init__(self, подробно: str, кратко: str, сумма: float):
+        self.подробно = подробно
+        self.кратко = кратко
+        self.сумма = сумма
+
+def _руб(сумма: float) -> str:
+    return f"{сумма:,.0f}".replace(",", " ")
+
+def текст_сводки(пачка, окно: float) -> str:
+    if len(пачка) == 1:
+        return пачка[0].подробно
+    итого = sum(у.сумма for у in пачка)
+    строки = [f"• {у.кратко}" for у in пачка[:СТРОК_В_СВОДКЕ]]
+    if len(пачка) > СТРОК_В_СВОДКЕ:
+        строки.append(f"… и ещё {len(пачка) - СТРОК_В_СВОДКЕ}")
+    return f"🔔 {len(пачка)} новых работ за {окно:g} с, итого {_руб(итого)} руб\n\n" + "\n".join(строки)
+
+class ДиспетчерУведомлений:
+    # Обработчики только кладут уведомление в очередь; отправкой владельцу
+    # занимается фоновая задача, так что /add не ждёт Telegram.
+    def __init__(self, бот, chat_id: int, режим: str = РЕЖИМ_ПО_УМОЛЧАНИЮ,
+                 окно: float = ОКНО_СКЛЕЙКИ, ведро: ТокенноеВедро = None):
+        self.бот = бот
+        self.chat_id = chat_id
+        self.режим = режим
+        self.окно = окно
+        self.ведро = ведро or ТокенноеВедро(ЁМКОСТЬ_ВЕДРА, СООБЩЕНИЙ_В_СЕКУНДУ)
+        self.очередь = asyncio.Queue()
+        self._стоп = object()
+
+    def уведомить(self, уведомление: Уведомление):
+        self.очередь.put_nowait(уведомление)
+
+    def остановить(self):
+        self.очередь.put_nowait(self._стоп)
+
+    async def _отправить(self, текст: str):
+        await self.ведро.взять()
+        try:
+            await self.бот.send_message(chat_id=self.chat_id, text=текст)
+        except Exception as e:
+            logger.error(f"Не удалось отправить уведомление: {e}")
+
+    async def _собрать_пачку(self, первое: Уведомление):
+        пачка = [первое]
+        срок = asyncio.get_running_loop().time() + self.окно
+        while True:
+            осталось = срок - asyncio.get_running_loop().time()
+            if осталось <= 0:
+                return пачка, False
+            try:
+                следующее = await asyncio.wait_for(self.очередь.get(), timeout=осталось)
+            except asyncio.TimeoutError:
+                return пачка, False
+            if следующее is self._стоп:
+                return пачка, True
+            пачка.append(следующее)
+
+    async def запустить(self):
+        while True:
+            уведомление = await self.очередь.get()
+            if уведомление is self._стоп:
+                return
+            if self.режим == "immediate":
+                await self._отправить(уведомление.подробно)
+                continue
+            пачка, остановлен = await self._собрать_пачку(уведомление)
+            await self._отправить(текст_сводки(пачка, self.окно))
+            if остановлен:
+                return
@@ -1,34 +1,170 @@
 import asyncio
 import logging
-from datetime import datetime
-from telegram import Bot
-from database import экспорт_в_csv
-from config import ТОКЕН_БОТА, ПОЛУЧАТЕЛЬ_ОТЧЁТОВ_ID
+from datetime import datetime, timedelta
+from telegram import InputFile
+from async_database import экспорт_в_csv, получить_сводку_по_операциям, выполненные_сроки, отметить_выполнение
+from database import границы_месяца
+from config import ПОЛУЧАТЕЛЬ_ОТЧЁТОВ_ID
+from sheets import сверить_с_google, текст_сверки
 
 logger = logging.getLogger(__name__)
 
-async def отправить_месячный_отчёт():
-    bot = Bot(token=ТОКЕН_БОТА)
-    try:
-        сейчас = datetime.now()
-        год = сейчас.year
-        месяц = сейчас.month - 1
-        if месяц == 0:
-            месяц = 12
-            год -= 1
-        путь = экспорт_в_csv(месяц=месяц, год=год)
-        подпись = f"📊 Отчёт за {datetime(год, месяц, 1).strftime('%B %Y')}"
-        with open(путь, "rb") as f:
-            await bot.send_document(chat_id=ПОЛУЧАТЕЛЬ_ОТЧЁТОВ_ID, document=f, caption=подпись)
-        logger.info("Месячный отчёт отправлен.")
-    except Exception as e:
-        logger.error(f"Ошибка отправки отчёта: {e}")
-
-async def запустить_планировщик():
-    while True:
-        сейчас = datetime.now()
-        if сейчас.day == 1 and сейчас.hour == 10 and сейчас.minute == 0:
-            await отправить_месячный_отчёт()
-            await asyncio.sleep(60)
-        else:
-            await asyncio.sleep(60)
\ No newline at end of file
+ЧАС_ОТЧЁТОВ = 10
+# Сверка с Google Таблицей — ночью, за последние ДНЕЙ_СВЕРКИ дней.
+ЧАС_СВЕРКИ = 3
+ДНЕЙ_СВЕРКИ = 31
+# Сколько пропущенных сроков одной задачи догонять после простоя.
+МАКС_ДОГОНЯТЬ = 12
+# Сон режется на отрезки, чтобы заметить перевод часов или сон машины.
+МАКС_СОН = 300
+# После сбоя самого планировщика (например, «database is locked») — повтор через столько секунд.
+ПАУЗА_ПОСЛЕ_ОШИБКИ = 60
+
+async def сводка_за_период(с: str, по: str) -> str:
+    строки = []
+    итого = 0.0
+    for код, колво, записей, ставка, сумма in await получить_сводку_по_операциям(с, по):
+        итого += сумма or 0
+        хвост = f"{сумма:.2f} руб" if ставка is not None else "без расценки"
+        строки.append(f"• {код}: {колво} ({записей} зап.) — {хвост}")
+    return "\n".join(строки + [f"ИТОГО: {итого:.2f} руб"])
+
+def предыдущий_месячный_срок(момент: datetime) -> datetime:
+    срок = момент.replace(day=1, hour=ЧАС_ОТЧЁТОВ, minute=0, second=0, microsecond=0)
+    if срок > момент:
+        срок = (срок - timedelta(days=1)).replace(day=1)
+    return срок
+
+def следующий_месячный_срок(момент: datetime) -> datetime:
+    срок = предыдущий_месячный_срок(момент)
+    return (срок + timedelta(days=32)).replace(day=1)
+
+def предыдущий_недельный_срок(момент: datetime) -> datetime:
+    срок = момент.replace(hour=ЧАС_ОТЧЁТОВ, minute=0, second=0, microsecond=0) - timedelta(days=момент.weekday())
+    if срок > момент:
+        срок -= timedelta(days=7)
+    return срок
+
+def следующий_недельный_срок(момент: datetime) -> datetime:
+    return предыдущий_недельный_срок(момент) + timedelta(days=7)
+
+def предыдущий_дневной_срок(момент: datetime) -> datetime:
+    срок = момент.replace(hour=ЧАС_СВЕРКИ, minute=0, second=0, microsecond=0)
+    if срок > момент:
+        срок -= timedelta(days=1)
+    return срок
+
+def следующий_дневной_срок(момент: datetime) -> datetime:
+    return предыдущий_дневной_срок(момент) + timedelta(days=1)
+
+async def отправить_месячный_отчёт(бот, срок: datetime):
+    # Срок — 1-е число; отчёт за предыдущий месяц.
+    прошлый = срок - timedelta(days=1)
+    год, месяц = прошлый.year, прошлый.month
+    файл, имя_файла = await экспорт_в_csv(месяц=месяц, год=год)
+    сводка = await сводка_за_период(*границы_месяца(год, месяц))
+    подпись = f"📊 Отчёт за {datetime(год, месяц, 1).strftime('%B %Y')}\n\n{сводка}"
+    # Файл экспорта без имени — PTB принимает только байты или InputFile.
+    with файл:
+        документ = InputFile(await asyncio.to_thread(файл.read), filename=имя_файла)
+    await бот.send_document(chat_id=ПОЛУЧАТЕЛЬ_ОТЧЁТОВ_ID, document=документ, caption=подпись)
+    logger.info("Месячный отчёт отправлен.")
+
+async def отправить_недельную_сводку(бот, срок: datetime):
+    с = (срок - timedelta(days=7)).date()
+    по = срок.date()
+    сводка = await сводка_за_период(с.isoformat(), по.isoformat())
+    последний_день = по - timedelta(days=1)
+    await бот.send_message(
+        chat_id=ПОЛУЧАТЕЛЬ_ОТЧЁТОВ_ID,
+        text=f"🗓 Сводка за неделю {с:%d.%m} – {последний_день:%d.%m.%Y}\n\n{сводка}"
+    )
+    logger.info("Недельная сводка отправлена.")
+
+async def сверить_таблицу(бот, срок: datetime):
+    по = срок.date() + timedelta(days=1)
+    отчёт = await сверить_с_google((по - timedelta(days=ДНЕЙ_СВЕРКИ)).isoformat(), по.isoformat())
+    # Пишем только когда было что чинить или показать.
+    if отчёт["недостающие"] or отчёт["расхождения"] or отчёт["повторы"]:
+        await бот.send_message(chat_id=ПОЛУЧАТЕЛЬ_ОТЧЁТОВ_ID, text=текст_сверки(отчёт))
+    logger.info("Сверка с Google Таблицей выполнена.")
+
+class Задача:
+    def __init__(self, имя: str, предыдущий_срок, следующий_срок, действие):
+        self.имя = имя
+        self.предыдущий_срок = предыдущий_срок
+        self.следующий_срок = следующий_срок
+        self.действие = действие
+
+ЗАДАЧИ_ПО_УМОЛЧАНИЮ = [
+    Задача("месячный_отчёт", предыдущий_месячный_срок, следующий_месячный_срок, отправить_месячный_отчёт),
+    Задача("недельная_сводка", предыдущий_недельный_срок, следующий_недельный_срок, отправить_недельную_сводку),
+    Задача("сверка_google", предыдущий_дневной_срок, следующий_дневной_срок, сверить_таблицу),
+]
+
+class Планировщик:
+    # Спит ровно до ближайшего срока среди зарегистрированных задач.
+    # Выполненные сроки пишутся в works.db, поэтому после перезапуска
+    # пропущенные сроки догоняются, а уже сделанные не повторяются.
+    def __init__(self, бот, задачи=None, часы=datetime.now, макс_сон: float = МАКС_СОН):
+        self.бот = бот
+        self.задачи = list(ЗАДАЧИ_ПО_УМОЛЧАНИЮ if задачи is None else задачи)
+        self.часы = часы
+        self.макс_сон = макс_сон
+        self.остановка = asyncio.Event()
+
+    def зарегистрировать(self, задача: Задача):
+        self.задачи.append(задача)
+
+    async def догнать(self):
+        сейчас = self.часы()
+        for задача in self.задачи:
+            выполнено = await выполненные_сроки(задача.имя)
+            срок = задача.предыдущий_срок(сейчас)
+            if not выполнено:
+                # Истории ещё нет (первый запуск): прошедший срок уже обработал
+                # прежний цикл, поэтому только отмечаем его и ждём следующего.
+                await отметить_выполнение(задача.имя, срок.isoformat())
+                logger.info(f"Задача {задача.имя}: история пуста, отсчёт со срока {срок.isoformat()}")
+                continue
+            пропущено = []
+            while срок.isoformat() not in выполнено and len(пропущено) < МАКС_ДОГОНЯТЬ:
+                пропущено.append(срок)
+                срок = задача.предыдущий_срок(срок - timedelta(seconds=1))
+            for срок in reversed(пропущено):
+                await self._выполнить(задача, срок)
+
+    async def _выполнить(self, задача: Задача, срок: datetime):
+        ключ = срок.isoformat()
+        if ключ in await выполненные_сроки(задача.имя):
+            return
+        try:
+            await задача.действие(self.бот, срок)
+        except Exception as e:
+            logger.error(f"Задача {задача.имя} на {ключ} не выполнена: {e}")
+            return
+        await отметить_выполнение(задача.имя, ключ)
+
+    async def _спать_до(self, срок: datetime):
+        while not self.остановка.is_set():
+            осталось = (срок - self.часы()).total_seconds()
+            if осталось <= 0:
+                return
+            try:
+                await asyncio.wait_for(self.остановка.wait(), timeout=min(осталось, self.макс_сон))
+            except asyncio.TimeoutError:
+                pass
+
+    async def запустить(self):
+        while not self.остановка.is_set():
+            try:
+                # Догоняем заодно и сроки, которые раньше завершились ошибкой.
+                await self.догнать()
+                срок = min(задача.следующий_срок(self.часы()) for задача in self.задачи)
+            except Exception as e:
+                logger.error(f"Ошибка планировщика, повтор через {ПАУЗА_ПОСЛЕ_ОШИБКИ} с: {e}")
+                срок = self.часы() + timedelta(seconds=ПАУЗА_ПОСЛЕ_ОШИБКИ)
+            await self._спать_до(срок)
+
+    def остановить(self):
+        self.остановка.set()
@@ -1,17 +1,208 @@
+import asyncio
+import logging
+from collections import Counter
 import gspread
 from oauth2client.service_account import ServiceAccountCredentials
 from config import GOOGLE_SHEET_ID, GOOGLE_CREDENTIALS_FILE
-from datetime import datetime
+from metrics import замер
+from async_database import (
+    получить_очередь_google, удалить_из_очереди_google, отметить_попытку_google, работы_для_сверки,
+    снять_отложенные_google
+)
+from database import МАКС_ПОПЫТОК_GOOGLE
 
-def добавить_в_google(имя, код_операции, количество, ставка, сумма, user_id):
+logger = logging.getLogger(__name__)
+
+ЗАГОЛОВОК = ["Дата", "Сотрудник", "Операция", "Кол-во", "Ставка", "Сумма", "User ID", "ID работы"]
+РАЗМЕР_ПАЧКИ = 100
+ПАУЗА_ПРОСТОЯ = 30
+БАЗОВАЯ_ЗАДЕРЖКА = 2
+МАКС_ЗАДЕРЖКА = 600
+
+_разбудить = asyncio.Event()
+
+def открыть_лист():
+    scope = ["https://spreadsheets.google.com/feeds", "https://www.googleapis.com/auth/drive"]
+    creds = ServiceAccountCredentials.from_json_keyfile_name(GOOGLE_CREDENTIALS_FILE, scope)
+    client = gspread.authorize(creds)
+    return client.open_by_key(GOOGLE_SHEET_ID).sheet1
+
+def разбудить_отправку():
+    _разбудить.set()
+
+def _строка_листа(дата, имя, код_операции, количество, ставка, сумма, user_id, работа_id):
+    return [дата[:16].replace("T", " "), имя, код_операции, количество, ставка or "", сумма or "", user_id, работа_id]
+
+async def _вызвать(имя: str, функция, *args, **kwargs):
+    with замер("sheets", имя):
+        return await asyncio.to_thread(функция, *args, **kwargs)
+
+async def _подготовить_лист(открыть):
+    лист = await _вызвать("open", открыть)
+    заголовок = await _вызвать("row_values", лист.row_values, 1)
+    if not заголовок:
+        await _вызвать("append_row", лист.append_row, ЗАГОЛОВОК)
+    elif len(заголовок) < len(ЗАГОЛОВОК):
+        # Старые листы без столбца «ID работы»: дописываем недостающие заголовки.
+        for столбец in range(len(заголовок), len(ЗАГОЛОВОК)):
+            await _вызвать("update_cell", лист.update_cell, 1, столбец + 1, ЗАГОЛОВОК[столбец])
+    return лист
+
+async def _ждать(секунд: float, остановка: asyncio.Event):
+    # Спим до таймаута, новой работы или команды остановки.
+    пробуждение = asyncio.ensure_future(_разбудить.wait())
+    стоп = asyncio.ensure_future(остановка.wait())
+    try:
+        await asyncio.wait({пробуждение, стоп}, timeout=секунд, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        пробуждение.cancel()
+        стоп.cancel()
+
+async def _ждать_остановку(секунд: float, остановка: asyncio.Event):
     try:
-        scope = ["https://spreadsheets.google.com/feeds", "https://www.googleapis.com/auth/drive"]
-        creds = ServiceAccountCredentials.from_json_keyfile_name(GOOGLE_CREDENTIALS_FILE, scope)
-        client = gspread.authorize(creds)
-        sheet = client.open_by_key(GOOGLE_SHEET_ID).sheet1
-        if not sheet.get_all_values():
-            sheet.append_row(["Дата", "Сотрудник", "Операция", "Кол-во", "Ставка", "Сумма", "User ID"])
-        now = datetime.now().strftime("%Y-%m-%d %H:%M")
-        sheet.append_row([now, имя, код_операции, количество, ставка or "", сумма or "", user_id])
-    except Exception as e:
-        print(f"Ошибка записи в Google Таблицу: {e}")
\ No newline at end of file
+        await asyncio.wait_for(остановка.wait(), timeout=секунд)
+    except asyncio.TimeoutError:
+        pass
+
+async def запустить_отправку_в_google(открыть=открыть_лист, остановка: asyncio.Event = None):
+    # Фоновый отправщик: забирает пачку из очереди_google, отправляет одним
+    # append_rows и удаляет отправленное. Клиент авторизуется один раз и
+    # переоткрывается только после ошибки; повторы — с экспоненциальной паузой.
+    # Неудачная пачка сразу делится пополам, пока плохая строка не останется
+    # одна: деление идёт без пауз, а пауза растёт только при повторных сбоях
+    # одиночной строки или чтения очереди. Попытки считаются только одиночной
+    # строке — она уходит в конец очереди, за ней пачка снова растёт вдвое,
+    # а после МАКС_ПОПЫТОК_GOOGLE строка откладывается совсем.
+    остановка = остановка or asyncio.Event()
+    лист = None
+    задержка = БАЗОВАЯ_ЗАДЕРЖКА
+    размер = РАЗМЕР_ПАЧКИ
+    while not остановка.is_set():
+        _разбудить.clear()
+        очередь = []
+        try:
+            очередь = await получить_очередь_google(размер)
+            if not очередь:
+                await _ждать(ПАУЗА_ПРОСТОЯ, остановка)
+                continue
+            if лист is None:
+                лист = await _подготовить_лист(открыть)
+            строки = [_строка_листа(*строка[2:]) for строка in очередь]
+            try:
+                await _вызвать("append_rows", лист.append_rows, строки, value_input_option="USER_ENTERED")
+            except Exception as e:
+                if len(очередь) == 1:
+                    raise
+                logger.warning(f"Google Таблица не приняла пачку из {len(очередь)} строк, делим пополам: {e}")
+                размер = len(очередь) // 2
+                continue
+            await удалить_из_очереди_google([строка[0] for строка in очередь])
+        except Exception as e:
+            logger.error(f"Ошибка отправки в Google Таблицу ({len(очередь)} строк), повтор через {задержка} с: {e}")
+            лист = None
+            try:
+                if len(очередь) == 1:
+                    await отметить_попытку_google([очередь[0][0]])
+                    if очередь[0][1] + 1 >= МАКС_ПОПЫТОК_GOOGLE:
+                        logger.error(
+                            f"Работа {очередь[0][-1]} отложена после {МАКС_ПОПЫТОК_GOOGLE} неудачных попыток; "
+                            "её допишет сверка (/reconcile)"
+                        )
+            except Exception as e:
+                logger.error(f"Не удалось отметить попытку: {e}")
+            await _ждать_остановку(задержка, остановка)
+            задержка = min(задержка * 2, МАКС_ЗАДЕРЖКА)
+            continue
+        задержка = БАЗОВАЯ_ЗАДЕРЖКА
+        размер = min(РАЗМЕР_ПАЧКИ, размер * 2)
+
+def _число(значение):
+    # Таблица отдаёт отформатированные строки: «2,5», «1 200».
+    try:
+        return float(str(значение).replace("\xa0", "").replace(" ", "").replace(",", "."))
+    except ValueError:
+        return значение
+
+def _сравнить(строки_листа, работы):
+    # Возвращает (недостающие работы, расхождения, повторы в листе).
+    # Строки без ID работы (до появления столбца) сопоставляются по
+    # сотруднику, операции и количеству — лучше пропустить, чем задвоить.
+    заголовок = строки_листа[0] if строки_листа else ЗАГОЛОВОК
+    позиция = {имя: i for i, имя in enumerate(заголовок)}
+    def ячейка(строка, имя):
+        i = позиция.get(имя)
+        return строка[i] if i is not None and i < len(строка) else ""
+
+    по_id = {}
+    повторы = set()
+    без_id = Counter()
+    for строка in строки_листа[1:]:
+        пид, код, колво = _число(ячейка(строка, "User ID")), ячейка(строка, "Операция"), _число(ячейка(строка, "Кол-во"))
+        работа_id = _число(ячейка(строка, "ID работы"))
+        if isinstance(работа_id, float):
+            работа_id = int(работа_id)
+            if работа_id in по_id:
+                повторы.add(работа_id)
+            по_id[работа_id] = (пид, код, колво)
+        else:
+            без_id[(пид, код, колво)] += 1
+
+    недостающие = []
+    расхождения = []
+    for работа in работы:
+        работа_id = работа[-1]
+        ожидается = (float(работа[6]), работа[2], float(работа[3]))
+        в_листе = по_id.get(работа_id)
+        if в_листе is None:
+            if без_id[ожидается] > 0:
+                без_id[ожидается] -= 1
+            else:
+                недостающие.append(работа)
+        elif в_листе != ожидается:
+            расхождения.append((работа_id, ожидается, в_листе))
+    return недостающие, расхождения, sorted(повторы)
+
+async def сверить_с_google(с: str, по: str, открыть=открыть_лист, дописать: bool = True) -> dict:
+    # Сначала база, потом лист: работа, которой уже нет в очереди, к моменту
+    # чтения листа точно отправлена, поэтому гонка с отправщиком не задваивает строки.
+    работы = await работы_для_сверки(с, по)
+    лист = await _подготовить_лист(открыть)
+    строки_листа = await _вызвать("get_all_values", лист.get_all_values)
+    недостающие, расхождения, повторы = _сравнить(строки_листа, работы)
+    if дописать and недостающие:
+        await _вызвать(
+            "append_rows", лист.append_rows,
+            [_строка_листа(*работа) for работа in недостающие], value_input_option="USER_ENTERED"
+        )
+        await снять_отложенные_google([работа[-1] for работа in недостающие])
+    logger.info(f"Сверка {с}–{по}: работ {len(работы)}, не хватало {len(недостающие)}, расхождений {len(расхождения)}")
+    return {
+        "с": с,
+        "по": по,
+        "работ": len(работы),
+        "недостающие": недостающие,
+        "дописано": дописать,
+        "расхождения": расхождения,
+        "повторы": повторы,
+    }
+
+def _описать(пид, код, колво) -> str:
+    показать = lambda значение: f"{значение:.10g}" if isinstance(значение, float) else значение
+    return f"{код} × {показать(колво)} (User ID {показать(пид)})"
+
+def текст_сверки(отчёт: dict, строк: int = 15) -> str:
+    части = [f"🔄 Сверка с Google Таблицей {отчёт['с']} – {отчёт['по']}: работ в базе {отчёт['работ']}"]
+    недостающие = отчёт["недостающие"]
+    if недостающие:
+        действие = "дописано" if отчёт["дописано"] else "не хватает"
+        части.append(f"➕ {действие}: {len(недостающие)} (ID {', '.join(str(р[-1]) for р in недостающие[:строк])}"
+                     + ("…" if len(недостающие) > строк else "") + ")")
+    for работа_id, в_базе, в_листе in отчёт["расхождения"][:строк]:
+        части.append(f"⚠️ ID {работа_id}: в базе {_описать(*в_базе)}, в таблице {_описать(*в_листе)}")
+    if len(отчёт["расхождения"]) > строк:
+        части.append(f"… и ещё {len(отчёт['расхождения']) - строк} расхождений")
+    if отчёт["повторы"]:
+        части.append(f"⚠️ Повторы в таблице: ID {', '.join(map(str, отчёт['повторы'][:строк]))}")
+    if len(части) == 1:
+        части.append("✅ Всё сходится.")
+    return "\n".join(части)
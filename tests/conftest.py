@@ -0,0 +1,31 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import database
+import db_pool
+import loadtest
+
+# config.py с токенами в репозитории нет — тестам хватает заглушки.
+loadtest._подключить_конфиг()
+
+АДМИН_ID = loadtest.АДМИН_ID
+РАБОТНИК_ID = 2
+
+@pytest.fixture
+def база(tmp_path):
+    прежняя = database.ИМЯ_БАЗЫ
+    database.ИМЯ_БАЗЫ = str(tmp_path / "works.db")
+    database.инициализировать_базу()
+    database.добавить_пользователя(АДМИН_ID, "админ", админ=True)
+    database.добавить_пользователя(РАБОТНИК_ID, "работник")
+    database.установить_расценку("sb_dron", 100.0)
+    database.загрузить_доступ()
+    yield database.ИМЯ_БАЗЫ
+    db_pool.закрыть_все()
+    database.сбросить_кэш_расценок()
+    database.сбросить_кэш_статистики()
+    database.ИМЯ_БАЗЫ = прежняя
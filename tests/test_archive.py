@@ -0,0 +1,34 @@
+import asyncio
+
+import archive
+import database
+import sheets
+from conftest import РАБОТНИК_ID
+from loadtest import ФейковыйЛист
+
+def _работы_за(месяц: str, количество: list):
+    with database._пул().запись() as соединение:
+        соединение.executemany(
+            "INSERT INTO работы (пользователь_id, имя, код_операции, количество, дата) VALUES (?, ?, ?, ?, ?)",
+            [(РАБОТНИК_ID, "работник", "sb_dron", колво, f"{месяц}-0{i + 1}T10:00:00") for i, колво in enumerate(количество)]
+        )
+    database.перестроить_итоги()
+
+def _экспорт(**параметры) -> bytes:
+    файл, _ = database.экспорт_в_csv(**параметры)
+    with файл:
+        return файл.read()
+
+def test_экспорт_и_сверка_видят_архив(база):
+    _работы_за("2024-01", [1, 2, 3])
+    _работы_за("2024-02", [4])
+    до = _экспорт(с="2024-01-01", по="2024-03-01")
+
+    assert archive.архивировать_месяц(2024, 1) == (3, 6.0)
+    assert _экспорт(с="2024-01-01", по="2024-03-01") == до
+    assert database.проверить_итоги() == []
+
+    лист = ФейковыйЛист()
+    отчёт = asyncio.run(sheets.сверить_с_google("2024-01-01", "2024-03-01", открыть=lambda: лист))
+    assert отчёт["работ"] == 4
+    assert sorted(строка[3] for строка in лист.строки[1:]) == [1, 2, 3, 4]
@@ -0,0 +1,56 @@
+import asyncio
+import io
+import time
+
+import bot
+import database
+import fake_telegram as ft
+from conftest import АДМИН_ID, РАБОТНИК_ID
+
+ДОЛГИЙ_ЭКСПОРТ = 1.0
+
+def test_долгий_экспорт_не_задерживает_me(база, monkeypatch):
+    def медленный_экспорт(*args, **kwargs):
+        time.sleep(ДОЛГИЙ_ЭКСПОРТ)
+        return io.BytesIO(b"csv"), "экспорт.csv"
+
+    monkeypatch.setattr(database, "экспорт_в_csv", медленный_экспорт)
+    database.добавить_работу(РАБОТНИК_ID, "работник", "sb_dron", 2)
+
+    async def прогон():
+        бот = ft.ФейковыйБот()
+        начало = time.perf_counter()
+        завершено = {}
+
+        async def выполнить(имя, обработчик, update, context):
+            await обработчик(update, context)
+            завершено[имя] = time.perf_counter() - начало
+            return update
+
+        экспорт = asyncio.create_task(выполнить(
+            "export", bot.экспорт_команда,
+            *ft.команда(бот, {}, {}, ft.ФейковыйПользователь(АДМИН_ID, "админ"), "/export"),
+        ))
+        await asyncio.sleep(0.05)
+        me = await выполнить(
+            "me", bot.моя_зп_сегодня,
+            *ft.команда(бот, {}, {}, ft.ФейковыйПользователь(РАБОТНИК_ID, "работник"), "/me"),
+        )
+        await экспорт
+        return завершено, me
+
+    завершено, me = asyncio.run(прогон())
+    assert "ИТОГО: 200.00 руб" in me.message.ответы[0]
+    assert завершено["me"] < ДОЛГИЙ_ЭКСПОРТ / 2
+    assert завершено["export"] >= ДОЛГИЙ_ЭКСПОРТ
+
+def test_экспорт_отправляет_документ(база):
+    # Настоящий экспорт (SpooledTemporaryFile) проходит разбор документа, как в PTB.
+    database.добавить_работу(РАБОТНИК_ID, "работник", "sb_dron", 2)
+    бот = ft.ФейковыйБот()
+    update, context = ft.команда(бот, {}, {}, ft.ФейковыйПользователь(АДМИН_ID, "админ"), "/export")
+    asyncio.run(bot.экспорт_команда(update, context))
+
+    assert not any(ответ.startswith("❌") for ответ in update.message.ответы)
+    [(chat_id, имя_файла, размер)] = бот.документы
+    assert chat_id == АДМИН_ID and имя_файла.endswith(".csv") and размер > 0
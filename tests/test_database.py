@@ -0,0 +1,55 @@
+from contextlib import contextmanager
+
+import benchmark
+import database
+import db_pool
+from conftest import РАБОТНИК_ID
+
+НОВЫЙ_ID = 77
+
+def test_загрузка_доступа_не_затирает_выдачу(база, monkeypatch):
+    пул = database._пул()
+    исходное_чтение = пул.чтение
+
+    @contextmanager
+    def чтение_с_выдачей():
+        # /grant коммитится между выборкой и присваиванием множеств.
+        with исходное_чтение() as соединение:
+            строки = соединение.execute("SELECT id, админ FROM пользователи").fetchall()
+        database.добавить_пользователя(НОВЫЙ_ID, "новый")
+
+        class Снимок:
+            def execute(self, *args):
+                return self
+
+            def fetchall(self):
+                return строки
+
+        yield Снимок()
+
+    monkeypatch.setattr(пул, "чтение", чтение_с_выдачей)
+    database.загрузить_доступ()
+    monkeypatch.undo()
+
+    assert database.проверить_доступ(НОВЫЙ_ID)
+    assert database.проверить_доступ(РАБОТНИК_ID)
+
+def test_сверка_итогов_терпит_погрешность_суммы(база):
+    for _ in range(10):
+        database.добавить_работу(РАБОТНИК_ID, "работник", "sb_dron", 0.1)
+    with database._пул().запись() as соединение:
+        # Пошаговое сложение десяти 0.1 даёт 0.9999999999999999, SUM() с компенсацией — 1.0.
+        соединение.execute("UPDATE итоги_по_дням SET количество = 0.9999999999999999")
+    assert database.проверить_итоги() == []
+
+    with database._пул().запись() as соединение:
+        соединение.execute("UPDATE итоги_по_дням SET количество = 1.1")
+    assert len(database.проверить_итоги()) == 1
+
+def test_запросы_по_датам_без_scan(tmp_path, monkeypatch):
+    # проверить_планы переключает ИМЯ_БАЗЫ — monkeypatch вернёт прежнее.
+    monkeypatch.setattr(database, "ИМЯ_БАЗЫ", database.ИМЯ_БАЗЫ)
+    try:
+        assert benchmark.проверить_планы(str(tmp_path / "планы.db")) == []
+    finally:
+        db_pool.закрыть_все()
@@ -0,0 +1,18 @@
+import types
+
+import metrics
+
+def test_инструментируются_только_обращения_к_пулу():
+    модуль = types.ModuleType("фейковая_база")
+    exec(
+        "_пул = None\n"
+        "def кэш_свежий(): return True\n"
+        "def прочитать(): return _пул\n"
+        "def строки(): yield _пул\n"
+        "def экспорт(): return list(строки())\n",
+        модуль.__dict__,
+    )
+    metrics.инструментировать_модуль(модуль, "db", использует="_пул")
+
+    замерено = {имя for имя, объект in vars(модуль).items() if getattr(объект, "_замерено", False)}
+    assert замерено == {"прочитать", "экспорт"}
@@ -0,0 +1,64 @@
+import asyncio
+import sqlite3
+import time
+from datetime import datetime, timedelta
+
+import database
+import scheduler
+
+НАЧАЛО = datetime(2024, 3, 10, 12, 0)
+
+def _часы():
+    # Часы идут от фиксированного момента, чтобы сроки не зависели от даты прогона.
+    старт = time.monotonic()
+    return lambda: НАЧАЛО + timedelta(seconds=time.monotonic() - старт)
+
+def _полночь(момент: datetime) -> datetime:
+    return момент.replace(hour=0, minute=0, second=0, microsecond=0)
+
+async def _прогнать(планировщик, пока):
+    задача = asyncio.create_task(планировщик.запустить())
+    for _ in range(200):
+        if пока() or задача.done():
+            break
+        await asyncio.sleep(0.01)
+    планировщик.остановить()
+    await задача
+
+def test_сбой_базы_не_останавливает_планировщик(база, monkeypatch):
+    выполнено = []
+
+    async def действие(бот, срок):
+        выполнено.append(срок)
+
+    database.отметить_выполнение("тест", datetime(2024, 3, 9).isoformat())
+    исходная = scheduler.выполненные_сроки
+    сбоев = []
+
+    async def сбоящая(задача):
+        if not сбоев:
+            сбоев.append(1)
+            raise sqlite3.OperationalError("database is locked")
+        return await исходная(задача)
+
+    monkeypatch.setattr(scheduler, "выполненные_сроки", сбоящая)
+    monkeypatch.setattr(scheduler, "ПАУЗА_ПОСЛЕ_ОШИБКИ", 0.01)
+    задача = scheduler.Задача("тест", _полночь, lambda момент: _полночь(момент) + timedelta(days=1), действие)
+    планировщик = scheduler.Планировщик(None, [задача], часы=_часы(), макс_сон=0.01)
+
+    asyncio.run(_прогнать(планировщик, lambda: выполнено))
+    assert сбоев and выполнено == [datetime(2024, 3, 10)]
+    assert datetime(2024, 3, 10).isoformat() in database.выполненные_сроки("тест")
+
+def test_первый_запуск_не_повторяет_прошедший_срок(база):
+    выполнено = []
+
+    async def действие(бот, срок):
+        выполнено.append(срок)
+
+    задача = scheduler.Задача("тест", _полночь, lambda момент: _полночь(момент) + timedelta(days=1), действие)
+    планировщик = scheduler.Планировщик(None, [задача], часы=_часы(), макс_сон=0.01)
+
+    asyncio.run(_прогнать(планировщик, lambda: database.выполненные_сроки("тест")))
+    assert выполнено == []
+    assert database.выполненные_сроки("тест") == {datetime(2024, 3, 10).isoformat()}
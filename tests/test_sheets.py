@@ -0,0 +1,81 @@
+import asyncio
+import time
+
+import pytest
+
+import async_database
+import database
+import sheets
+from conftest import РАБОТНИК_ID
+from loadtest import ФейковыйЛист
+
+class ПридирчивыйЛист(ФейковыйЛист):
+    # Отвергает любую пачку, где есть «плохая» операция.
+    def append_rows(self, строки, **kwargs):
+        if any(строка[2] == "плохая" for строка in строки):
+            raise RuntimeError("400 Bad Request")
+        super().append_rows(строки, **kwargs)
+
+@pytest.fixture
+def быстрые_повторы(monkeypatch):
+    monkeypatch.setattr(sheets, "БАЗОВАЯ_ЗАДЕРЖКА", 0.001)
+    monkeypatch.setattr(sheets, "МАКС_ЗАДЕРЖКА", 0.001)
+
+async def _прогнать_отправщик(открыть, пока):
+    остановка = asyncio.Event()
+    задача = asyncio.create_task(sheets.запустить_отправку_в_google(открыть=открыть, остановка=остановка))
+    for _ in range(500):
+        if пока():
+            break
+        sheets.разбудить_отправку()
+        await asyncio.sleep(0.01)
+    остановка.set()
+    await задача
+
+def test_плохая_строка_откладывается_и_не_держит_очередь(база, быстрые_повторы):
+    database.добавить_работы(РАБОТНИК_ID, "работник", [("sb_dron", 1), ("плохая", 1), ("sb_dron", 2), ("sb_dron", 3)])
+    лист = ПридирчивыйЛист()
+    asyncio.run(_прогнать_отправщик(lambda: лист, lambda: not database.получить_очередь_google()))
+
+    assert [строка[3] for строка in лист.строки[1:]] == [1, 2, 3]
+    with database._пул().чтение() as соединение:
+        assert соединение.execute("SELECT попыток FROM очередь_google").fetchall() == [(database.МАКС_ПОПЫТОК_GOOGLE,)]
+
+    # Отложенную строку дописывает сверка и снимает её из очереди.
+    async def сверка():
+        лист.append_rows = lambda строки, **kwargs: ФейковыйЛист.append_rows(лист, строки)
+        return await sheets.сверить_с_google("2000-01-01", "2100-01-01", открыть=lambda: лист)
+
+    отчёт = asyncio.run(сверка())
+    assert len(отчёт["недостающие"]) == 1
+    with database._пул().чтение() as соединение:
+        assert соединение.execute("SELECT COUNT(*) FROM очередь_google").fetchone() == (0,)
+
+def test_плохая_строка_держит_очередь_не_дольше_одной_паузы(база, monkeypatch):
+    # Деление пачки идёт без пауз, поэтому строки за плохой уходят после
+    # одной базовой задержки, а не после растущей серии повторов.
+    monkeypatch.setattr(sheets, "БАЗОВАЯ_ЗАДЕРЖКА", 0.05)
+    monkeypatch.setattr(sheets, "МАКС_ЗАДЕРЖКА", 10)
+    database.добавить_работы(РАБОТНИК_ID, "работник", [("плохая", 1)] + [("sb_dron", i) for i in range(1, 21)])
+    лист = ПридирчивыйЛист()
+
+    начало = time.perf_counter()
+    asyncio.run(_прогнать_отправщик(lambda: лист, lambda: len(лист.строки) == 21))
+    assert time.perf_counter() - начало < 10 * sheets.БАЗОВАЯ_ЗАДЕРЖКА
+    assert [строка[3] for строка in лист.строки[1:]] == list(range(1, 21))
+
+def test_сбой_базы_не_роняет_отправщик(база, быстрые_повторы, monkeypatch):
+    database.добавить_работу(РАБОТНИК_ID, "работник", "sb_dron", 1)
+    исходная = async_database.получить_очередь_google
+    сбоев = []
+
+    async def сбоящая(лимит):
+        if not сбоев:
+            сбоев.append(1)
+            raise RuntimeError("database is locked")
+        return await исходная(лимит)
+
+    monkeypatch.setattr(sheets, "получить_очередь_google", сбоящая)
+    лист = ФейковыйЛист()
+    asyncio.run(_прогнать_отправщик(lambda: лист, lambda: len(лист.строки) == 2))
+    assert сбоев and len(лист.строки) == 2
@@ -0,0 +1,21 @@
+import asyncio
+
+import pytest
+
+import webhook
+
+def test_неверный_секрет_даёт_403():
+    принятые = []
+    клиент = webhook.создать_flask_приложение("s3cret", принятые.append).test_client()
+
+    for заголовок in ("секрет", "wrong", ""):
+        ответ = клиент.post(webhook.ПУТЬ_ПО_УМОЛЧАНИЮ, json={"update_id": 1},
+                            headers={webhook.ЗАГОЛОВОК_СЕКРЕТА: заголовок})
+        assert ответ.status_code == 403
+    ответ = клиент.post(webhook.ПУТЬ_ПО_УМОЛЧАНИЮ, json={"update_id": 1},
+                        headers={webhook.ЗАГОЛОВОК_СЕКРЕТА: "s3cret"})
+    assert ответ.status_code == 200 and принятые == [{"update_id": 1}]
+
+def test_недопустимый_секрет_отвергается_при_запуске():
+    with pytest.raises(RuntimeError, match="ВЕБХУК_СЕКРЕТ"):
+        asyncio.run(webhook.запустить_вебхук(None, "секрет"))
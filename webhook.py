@@ -0,0 +1,96 @@
+import asyncio
+import hmac
+import logging
+import re
+import signal
+import threading
+from telegram import Update
+
+logger = logging.getLogger(__name__)
+
+# Режим вебхука: Telegram (или локальный скрипт) POST-ит обновления в
+# Flask, а мы кладём их в update_queue приложения, где при
+# concurrent_updates они обрабатываются параллельно.
+#
+# Без ВЕБХУК_URL set_webhook не вызывается, а с config.АДРЕС_BOT_API,
+# указывающим на заглушку (python loadtest.py bot-api), бот не ходит в
+# Telegram вовсе — обновления можно POST-ить локально:
+#   curl -X POST -H "X-Telegram-Bot-Api-Secret-Token: $СЕКРЕТ" \
+#        -H "Content-Type: application/json" -d @update.json http://127.0.0.1:8443/telegram
+# или python loadtest.py webhook (см. loadtest.py).
+ЗАГОЛОВОК_СЕКРЕТА = "X-Telegram-Bot-Api-Secret-Token"
+ХОСТ_ПО_УМОЛЧАНИЮ = "127.0.0.1"
+ПОРТ_ПО_УМОЛЧАНИЮ = 8443
+ПУТЬ_ПО_УМОЛЧАНИЮ = "/telegram"
+# Telegram принимает secret_token только из этих символов.
+ДОПУСТИМЫЙ_СЕКРЕТ = re.compile(r"[A-Za-z0-9_-]{1,256}")
+
+def создать_flask_приложение(секрет: str, принять, путь: str = ПУТЬ_ПО_УМОЛЧАНИЮ):
+    # принять(данные) вызывается в потоке сервера с уже проверенным JSON.
+    from flask import Flask, Response, request
+
+    flask_app = Flask(__name__)
+
+    @flask_app.post(путь)
+    def обновление():
+        # Сравниваем байты: compare_digest на str с не-ASCII символами бросает TypeError.
+        if not hmac.compare_digest(request.headers.get(ЗАГОЛОВОК_СЕКРЕТА, "").encode(), секрет.encode()):
+            return Response(status=403)
+        данные = request.get_json(silent=True)
+        if not isinstance(данные, dict):
+            return Response(status=400)
+        try:
+            принять(данные)
+        except Exception as e:
+            logger.warning(f"Отклонено обновление: {e}")
+            return Response(status=400)
+        return Response(status=200)
+
+    return flask_app
+
+async def запустить_вебхук(приложение, секрет: str, хост: str = ХОСТ_ПО_УМОЛЧАНИЮ,
+                           порт: int = ПОРТ_ПО_УМОЛЧАНИЮ, путь: str = ПУТЬ_ПО_УМОЛЧАНИЮ, url: str = None):
+    # Тот же жизненный цикл, что и в run_polling, только вместо опроса —
+    # HTTP-сервер. Останавливается по SIGINT/SIGTERM: сначала перестаём
+    # принимать запросы, потом приложение дорабатывает очередь.
+    from werkzeug.serving import make_server
+
+    if not секрет:
+        raise RuntimeError("Для режима вебхука нужен ВЕБХУК_СЕКРЕТ")
+    if not ДОПУСТИМЫЙ_СЕКРЕТ.fullmatch(секрет):
+        raise RuntimeError("ВЕБХУК_СЕКРЕТ: Telegram допускает только A-Z, a-z, 0-9, _ и -, до 256 символов")
+    цикл = asyncio.get_running_loop()
+    остановка = asyncio.Event()
+    for сигнал in (signal.SIGINT, signal.SIGTERM):
+        try:
+            цикл.add_signal_handler(сигнал, остановка.set)
+        except (NotImplementedError, RuntimeError):
+            # Windows: остаётся KeyboardInterrupt, он тоже попадает в finally.
+            pass
+
+    def принять(данные: dict):
+        обновление = Update.de_json(данные, приложение.bot)
+        if обновление is None:
+            raise ValueError("пустое обновление")
+        цикл.call_soon_threadsafe(приложение.update_queue.put_nowait, обновление)
+
+    await приложение.initialize()
+    if приложение.post_init:
+        await приложение.post_init(приложение)
+    await приложение.start()
+    сервер = make_server(хост, порт, создать_flask_приложение(секрет, принять, путь), threaded=True)
+    поток = threading.Thread(target=сервер.serve_forever, name="вебхук", daemon=True)
+    поток.start()
+    logger.info(f"Вебхук: http://{хост}:{порт}{путь}")
+    try:
+        if url:
+            await приложение.bot.set_webhook(url + путь, secret_token=секрет, allowed_updates=Update.ALL_TYPES)
+        await остановка.wait()
+    finally:
+        сервер.shutdown()
+        поток.join()
+        await приложение.stop()
+        if приложение.post_stop:
+            await приложение.post_stop(приложение)
+        await приложение.shutdown()
+        logger.info("Вебхук остановлен.")